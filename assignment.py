@@ -1,49 +1,75 @@
+import contextlib
 import csv
 import difflib
+import io
+import multiprocessing
+import re
 import shutil
 import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-from typing import Union, List, Tuple
+from typing import Union, List, Tuple, Set, Optional, Dict
 from os import PathLike
 import rarfile
 
-from fileUtil import extract_file, separate_path_filename, decode_file_name
+from cache import ResultCache
+from corpus import Corpus
+from document import report_fingerprints, report_data_fingerprints
+from fingerprint import get_tokenizer, fingerprint_source, content_digest, digest_value
+from fileUtil import extract_file, separate_path_filename, decode_file_names, open_nested_archive, CHUNK_SIZE, \
+    SPILL_SIZE, WRITE_BUFFER, FileSizeExceeded, FileWriter, read_file
+from ignore import DEFAULT_PATTERNS, IgnoreMatcher
+from journal import Journal
+from layout import LayoutDir, LayoutFile, split_path, remove_single_src_dir, remove_single_begin_dir, \
+    remove_duplicate_dir
+from profiler import PROFILER, span, timed, count, profile_data, profile_worker
 from report import Report
-from source import Source, SourceAnalyzer
-from student import StudentInfo, Student
+from score import LOOSEST, REPORT_NAME_RATIO, export_reports, save_scores
+from screen import FeatureScreen
+from source import Source, SourceAnalyzer, CodeAnalyzer, DuplicateAnalyzer
+from student import StudentInfo, Student, ID_PATTERN, student_id
+
+CHECK_TILE = 64  # 并行检查时作业对分块的边长(作业数)
 
 
 class AssignmentChecker:
-    def __init__(self):
-        # 定义文件/目录忽略规则
-        self.__ignore_dirs = [
-            ".git",
-            ".idea",
-            "target",
-            "__MACOSX"
-        ]
-        self.__ignore_file_suffixes = [
-            ".class",
-            ".gitignore",
-            ".DS_Store",
-        ]
+    def __init__(self, max_file_size: Optional[int] = None, max_total_size: Optional[int] = None,
+                 chunk_size: int = CHUNK_SIZE, spill_size: int = SPILL_SIZE, max_depth: int = 8,
+                 ignore_patterns: Optional[List[str]] = None, write_workers: int = 4,
+                 write_buffer: int = WRITE_BUFFER, extract: bool = True):
+        """
+        :param ignore_patterns: 追加的gitignore风格忽略规则
+        :param write_workers: 后台写入解压文件的线程数，为0时同步写入
+        :param extract: 为False时不解压任何文件，只从压缩包中读取文件内容用于相似度检查
+        """
+        # 定义文件/目录忽略规则，编译为一个匹配器
+        self.__patterns: List[str] = DEFAULT_PATTERNS + (ignore_patterns or [])
+        self.__matcher = IgnoreMatcher(self.__patterns)
+        # 定义解压大小限制
+        self.max_file_size: Optional[int] = max_file_size  # 单个文件大小上限
+        self.max_total_size: Optional[int] = max_total_size  # 单份作业解压总大小上限
+        self.chunk_size: int = chunk_size  # 解压缓冲区大小
+        self.spill_size: int = spill_size  # 单份作业同时打开的嵌套压缩包内存缓冲总量上限，超过时写入临时文件
+        self.max_depth: int = max_depth  # 嵌套压缩包最大层数
+        self.write_workers: int = write_workers  # 后台写入线程数
+        self.write_buffer: int = write_buffer  # 后台写入队列中待写入数据的上限
+        self.extract: bool = extract  # 是否解压输出标准化后的作业
 
     # 检查路径
     def check_path(self, path: str) -> bool:
-        for i_dir in self.__ignore_dirs:
-            if i_dir in path:
-                return False
-        return True
+        return not self.__matcher.ignored_dir(path)
 
     # 检查文件
     def check_file(self, filename: str) -> bool:
-        for suffix in self.__ignore_file_suffixes:
-            if filename[-len(suffix):] == suffix:
-                return False
-        return True
+        return not self.__matcher.ignored_file(filename)
 
     def check_both(self, file_path: str) -> bool:
-        return self.check_file(file_path) and self.check_path(file_path)
+        """检查相对于作业根目录的文件路径，所在目录的结果会被缓存"""
+        return not self.__matcher.ignored(file_path)
+
+    def signature(self) -> tuple:
+        """影响处理结果的全部规则，用于判断缓存是否可用"""
+        return tuple(self.__patterns), self.max_file_size, self.max_total_size, self.max_depth
 
 
 class Assignment:
@@ -60,288 +86,657 @@ class Assignment:
         self.__checker: AssignmentChecker = checker
         self.source: Source = Source()
         self.reserve_doc: bool = reserve_doc
+        self.planned_size: int = 0  # 计划解压的总大小
+        self.skipped: List[Tuple[str, int, str]] = []  # 被跳过的文件清单(路径, 大小, 原因)
+        self.filtered_count: int = 0  # 被忽略规则过滤、未解压的文件数
+        self.filtered_bytes: int = 0  # 被忽略规则过滤、未解压的文件大小
+        self.__reports: List[LayoutFile] = []  # 待提取的实验报告
+        self.__buffered: int = 0  # 当前打开的嵌套压缩包占用的内存缓冲大小
 
     def process_assignment(self, assignment_zip: zipfile.ZipFile):
         """作业标准化处理入口
+        先在内存中规划输出目录(包含嵌套压缩包中的文件)并应用目录整理规则，再将每个文件直接解压到最终位置。
+        不解压时只从压缩包中读取源码与保留的报告计算指纹，不写入任何文件(包括被跳过文件清单)
         """
         original_filename = assignment_zip.filename[:-4]
-        # 遍历作业压缩包内的文件
-        for file in assignment_zip.filelist:
-            filename = decode_file_name(file.filename)
-
-            # 过滤去除多于的超星平台.doc文件
-            if filename[-len(original_filename) - 4:-4] == original_filename:
-                # print(filename)
-                continue
-
-            self.__process_file(assignment_zip, file, Path(self.src_path))
-
-        # 后序检查
-        path = Path(self.src_path)
-        if path.exists():
-            remove_single_src_dir(path)
-            remove_single_begin_dir(path, separate_path_filename(original_filename)[1])
-            remove_duplicate_dir(path)
-
-    def __process_file(self, archive: Union[zipfile.ZipFile, rarfile.RarFile], file: any, path: PathLike[str]):
-        """处理压缩包中文件
-        :param file: 压缩包文件句柄
-        :param path: 指定输出路径(doc文件除外)
+        root = LayoutDir(self.__name)
+        with contextlib.ExitStack() as archives:  # 嵌套压缩包在解压完成前保持打开
+            # 遍历作业压缩包内的文件
+            files = []
+            for file, filename in zip(assignment_zip.filelist, decode_file_names(assignment_zip.filelist)):
+                # 过滤去除多于的超星平台.doc文件
+                if filename[-len(original_filename) - 4:-4] == original_filename:
+                    # print(filename)
+                    continue
+                files.append((file, filename))
+
+            for file, filename in self.__prescan(files, ()):
+                self.__plan_file(assignment_zip, file, filename, root, (), archives, 0)
+
+            # 后序检查
+            if len(root) > 0:
+                with span("remove_single_src_dir"):
+                    remove_single_src_dir(root)
+                with span("remove_single_begin_dir"):
+                    remove_single_begin_dir(root, separate_path_filename(original_filename)[1])
+                with span("remove_duplicate_dir"):
+                    remove_duplicate_dir(root)
+
+            if self.__checker.extract:
+                self.__extract_all(root)
+            else:
+                self.__analyze(root)
+
+        if len(self.skipped) > 0 and self.__checker.extract:
+            self.__export_manifest()
+        if self.filtered_count > 0:
+            print(f"[Info]Filtered {self.filtered_count} members ({self.filtered_bytes} bytes) by ignore rules")
+
+    def clean_output(self):
+        """删除上次运行留下的源代码目录、实验报告与清单"""
+        shutil.rmtree(self.src_path, ignore_errors=True)
+        base_path = Path(self.__base_path)
+        if base_path.exists():
+            for sub in base_path.iterdir():
+                if sub.is_file() and (sub.name.startswith(f"{self.__name}.") or sub.name.startswith(f"{self.__name}-")):
+                    sub.unlink()
+
+    def __plan_file(self, archive: Union[zipfile.ZipFile, rarfile.RarFile], file: any, filename: str,
+                    root: LayoutDir, parts: Tuple[str, ...], archives: contextlib.ExitStack, depth: int):
+        """规划压缩包中文件的输出位置
+        :param file: 压缩包文件句柄，已经过__prescan过滤
+        :param filename: 解码后的文件名
+        :param parts: 文件所在目录相对于源代码目录的路径(doc文件除外)
+        :param depth: 所在压缩包的嵌套层数
         """
 
-        filename = decode_file_name(file.filename)
-
-        output_path = f"{path}/{filename}"
-
-        if file.is_dir() or not self.__checker.check_both(output_path):  # 使用特定规则忽略文件夹和文件
-            return
-
-        pure_path, filename = separate_path_filename(output_path)  # 获取纯路径
-
-        pure_path = Path(pure_path)
+        relative = parts + split_path(filename)  # 相对于源代码目录的路径
+        output_path = "/".join((self.src_path,) + parts + (filename,))
+        filename = relative[-1]
 
         suffix = Path(filename).suffix
 
+        record_path = output_path[len(self.src_path):]  # 记录用的相对路径
+
         if suffix in [".doc", ".docx"]:
             # 将后缀为类.doc的文件作为实验报告，每个学生有且仅有一份有效的实验报告，因此仅保留大小最大的文档。
+            reserved = self.__reserve(record_path, file.file_size)
+            if reserved:  # 超过大小限制的报告不参与比较
+                self.report.cmp_update(filename, file.file_size)
+                self.__reports.append(LayoutFile(archive, file, record_path))
 
-            if not self.report.cmp_update(filename, file.file_size):
-                extract_file(archive, file, self.__base_path, f"{self.__name}{suffix}")  # 将实验报告移动提取到根目录
-            else:
-                count = self.report.count
-                if count == 2:
-                    shutil.move(Path(self.__base_path) / f"{self.__name}{suffix}",
-                                Path(self.__base_path) / f"{self.__name}-1{suffix}")
-                extract_file(archive, file, self.__base_path, f"{self.__name}-{count}{suffix}")
-
-            if not self.reserve_doc:
+            if not self.reserve_doc or not reserved:
                 return
+            # 保留的报告同时输出到源代码目录，只计入一次解压总大小
+            root.add_file(relative, LayoutFile(archive, file, record_path, len(self.source)))
+            self.source.append(record_path, file.file_size)
+            return
 
-        # 处理zip文件
-        if filename[-4:] == ".zip":
-            with zipfile.ZipFile(archive.open(file, 'r'), 'r') as zip_file:
-                self.__process_zip(zip_file, pure_path)
-
-        # 处理rar文件
-        elif filename[-4:] == ".rar":
-            with rarfile.RarFile(archive.open(file, 'r'), 'r') as rar_file:
-                self.__process_rar(rar_file, pure_path)
+        # 处理zip/rar文件
+        if filename[-4:] in [".zip", ".rar"]:
+            with contextlib.ExitStack() as stack:
+                nested = self.__open_archive(archive, file, record_path, stack, depth + 1)
+                if nested is None:
+                    return
+                # 先读取压缩包目录，内容全部被过滤时不再保留该压缩包
+                files = nested.filelist if isinstance(nested, zipfile.ZipFile) else nested.infolist()
+                output = relative[-1][:-4]
+                kept = self.__prescan(list(zip(files, decode_file_names(files))), relative[:-1] + (output,))
+                if len(kept) == 0:
+                    print(f"[Info]Skip nested archive {record_path}: all members are filtered")
+                    return
+                archives.enter_context(stack.pop_all())
+            self.__plan_archive(nested, kept, root, relative, archives, depth + 1)
 
         # 其他文件解压输出到学生源代码代码目录
-        else:
+        elif self.__reserve(record_path, file.file_size):
             # 将文件路径信息添加到记录中，累加大小
-            self.source.append(output_path[len(self.src_path):], file.file_size)
-            extract_file(archive, file, pure_path, filename)
+            root.add_file(relative, LayoutFile(archive, file, record_path, len(self.source)))
+            self.source.append(record_path, file.file_size)
+
+    def __prescan(self, files: List[Tuple[any, str]], parts: Tuple[str, ...]) -> List[Tuple[any, str]]:
+        """预扫描压缩包目录，按忽略规则过滤文件(不解压)，统计被过滤的文件
+        :param files: (压缩包文件句柄, 解码后的文件名)
+        :param parts: 压缩包内容输出目录相对于源代码目录的路径
+        :return: 需要进一步处理的文件
+        """
+        kept = []
+        for file, filename in files:
+            if file.is_dir():
+                continue
+            relative = parts + split_path(filename)
+            # 使用特定规则忽略文件夹和文件，只检查相对路径，被忽略目录下的文件直接跳过
+            if len(relative) > 0 and self.__checker.check_both("/".join(relative)):
+                kept.append((file, filename))
+            else:
+                self.filtered_count += 1
+                self.filtered_bytes += file.file_size
+        return kept
+
+    def __open_archive(self, archive: Union[zipfile.ZipFile, rarfile.RarFile], file: any, record_path: str,
+                       archives: contextlib.ExitStack, depth: int) -> Union[zipfile.ZipFile, rarfile.RarFile, None]:
+        """打开嵌套压缩包，每层只解压一次到内存或临时文件
+        同时打开的全部内存缓冲不超过spill_size，超出时写入临时文件，关闭后归还额度。
+        :return: 超过嵌套层数或无法打开时返回None
+        """
+        if depth > self.__checker.max_depth:
+            self.__skip(record_path, file.file_size, "nested archive depth limit")
+            return None
+        budget = self.__checker.spill_size - self.__buffered
+        buffer = archives.enter_context(open_nested_archive(archive, file, budget, self.__checker.chunk_size))
+        if file.file_size <= budget:  # 读入内存
+            self.__buffered += file.file_size
+            archives.callback(self.__release, file.file_size)
+        try:
+            if record_path[-4:] == ".zip":
+                return archives.enter_context(zipfile.ZipFile(buffer, 'r'))
+            return archives.enter_context(rarfile.RarFile(buffer, 'r'))
+        except (zipfile.BadZipFile, rarfile.Error):
+            self.__skip(record_path, file.file_size, "broken archive")
+            return None
+
+    def __release(self, size: int):
+        """嵌套压缩包关闭后归还内存缓冲额度"""
+        self.__buffered -= size
+
+    def __plan_archive(self, archive: Union[zipfile.ZipFile, rarfile.RarFile], files: List[Tuple[any, str]],
+                       root: LayoutDir, relative: Tuple[str, ...], archives: contextlib.ExitStack, depth: int):
+        """规划嵌套压缩包，内容输出到与压缩包同名的目录
+        :param relative: 压缩包相对于源代码目录的路径
+        """
+        output = relative[-1][:-4]
+        parts = relative[:-1] + (output,)
+        for file, filename in files:
+            self.__plan_file(archive, file, filename, root, parts, archives, depth)
+        node = root.find(parts)
+        if node is not None:  # 压缩包内文件可能全部被忽略或跳过
+            with span("remove_single_begin_dir"):
+                remove_single_begin_dir(node, output)
+
+    def __extract_reports(self, writer: FileWriter) -> Optional[Path]:
+        """将实验报告提取到根目录，存在多份报告时依次编号
+        :return: 保留的(最大的)报告的路径，用于计算内容指纹
+        """
+        kept = max(self.__reports, key=lambda x: x.info.file_size, default=None)  # 与Report.cmp_update一致
+        result = None
+        for count, file in enumerate(self.__reports, 1):
+            suffix = Path(file.record_path).suffix
+            name = f"{self.__name}{suffix}" if len(self.__reports) == 1 else f"{self.__name}-{count}{suffix}"
+            if self.__extract(writer, file.archive, file.info, file.record_path, self.__base_path, name) \
+                    and file is kept:
+                result = Path(self.__base_path) / name
+        return result
+
+    def __extract_all(self, root: LayoutDir):
+        """解压报告与规划的全部文件，解压时计算文件内容哈希
+        解压与写入磁盘并行，全部写入后再读取源码文件计算指纹
+        """
+        extracted = []
+        with FileWriter(self.__checker.write_workers, self.__checker.write_buffer) as writer:
+            report = self.__extract_reports(writer)
+            for parts, filename, file in root.walk():
+                output_path = "/".join((self.src_path,) + parts)
+                digest = content_digest()
+                if self.__extract(writer, file.archive, file.info, file.record_path, output_path, filename, digest):
+                    self.source.hashes[file.index] = digest_value(digest)
+                    if get_tokenizer(filename) is not None:
+                        extracted.append((file.index, Path(output_path) / filename))
+        if report is not None:
+            with span("report_fingerprints"):
+                self.report.fingerprints = report_fingerprints(report)
+        for index, path in extracted:
+            with open(path, "rb") as f:
+                self.__fingerprint(index, path.name, f.read())
+
+    def __analyze(self, root: LayoutDir):
+        """不解压，直接从压缩包中读取保留的报告与全部文件，计算文件内容哈希与指纹"""
+        kept = max(self.__reports, key=lambda x: x.info.file_size, default=None)  # 与Report.cmp_update一致
+        if kept is not None:
+            data = self.__read(kept.archive, kept.info, kept.record_path)
+            if data is not None:
+                with span("report_fingerprints"):
+                    self.report.fingerprints = report_data_fingerprints(data, Path(kept.record_path).suffix)
+        for _, filename, file in root.walk():
+            digest = content_digest()
+            code = get_tokenizer(filename) is not None
+            data = self.__read(file.archive, file.info, file.record_path, digest, code)  # 只保留源码文件的内容
+            if data is not None:
+                self.source.hashes[file.index] = digest_value(digest)
+                if code:
+                    self.__fingerprint(file.index, filename, data)
+
+    @timed("fingerprint")
+    def __fingerprint(self, index: int, filename: str, data: bytes):
+        """计算源码文件的内容指纹与去除注释、空白后的哈希
+        :param index: 文件在源码记录中的下标
+        """
+        fingerprints, normalized = fingerprint_source(data.decode("utf-8", errors="ignore"), filename)
+        self.source.add_fingerprints(fingerprints)
+        self.source.normalized_hashes[index] = normalized
+
+    def __reserve(self, record_path: str, file_size: int) -> bool:
+        """检查文件大小限制并计入作业解压总大小，超过限制时记录到清单
+        :return: 未超过限制时返回True
+        """
+        checker = self.__checker
+        if checker.max_file_size is not None and file_size > checker.max_file_size:
+            self.__skip(record_path, file_size, "file size limit")
+            return False
+        if checker.max_total_size is not None and self.planned_size + file_size > checker.max_total_size:
+            self.__skip(record_path, file_size, "assignment size limit")
+            return False
+        self.planned_size += file_size
+        return True
 
-    def __process_zip(self, archive: zipfile.ZipFile, path: Path):
-        """处理zip文件
+    def __extract(self, writer: FileWriter, archive: Union[zipfile.ZipFile, rarfile.RarFile], file: any,
+                  record_path: str, output_path: PathLike[str], output_filename: str, digest: any = None) -> bool:
+        """提取文件，设置了大小限制时实际大小不得超过压缩包中记录的大小
+        :param digest: 以文件内容更新的哈希对象
+        :return: 成功提取时返回True
         """
-        # 遍历zip中文件
-        output = get_archive_output_path(archive.filename)
-        for file in archive.filelist:
-            self.__process_file(archive, file, path / output)
-        remove_single_begin_dir(path / output, output)
-
-    def __process_rar(self, archive: rarfile.RarFile, path: Path):
-        """处理rar文件
+        checker = self.__checker
+        limit = None if checker.max_file_size is None and checker.max_total_size is None else file.file_size
+        try:
+            extract_file(archive, file, output_path, output_filename, checker.chunk_size, limit, writer, digest)
+        except FileSizeExceeded as e:
+            self.__skip(record_path, e.size, "file size exceeds declared size")
+            return False
+        return True
+
+    def __read(self, archive: Union[zipfile.ZipFile, rarfile.RarFile], file: any, record_path: str,
+               digest: any = None, keep: bool = True) -> Optional[bytes]:
+        """读取文件内容，大小限制与__extract相同
+        :param keep: 为False时只计算哈希，返回空字节串
+        :return: 超过限制时返回None
         """
-        # 遍历rar中文件
-        output = get_archive_output_path(archive.filename)
-        for file in archive.infolist():
-            self.__process_file(archive, file, path / output)
-        remove_single_begin_dir(path / output, output)
+        checker = self.__checker
+        limit = None if checker.max_file_size is None and checker.max_total_size is None else file.file_size
+        try:
+            return read_file(archive, file, checker.chunk_size, limit, digest, keep)
+        except FileSizeExceeded as e:
+            self.__skip(record_path, e.size, "file size exceeds declared size")
+            return None
+
+    def __skip(self, record_path: str, size: int, reason: str):
+        """记录被跳过的文件"""
+        print(f"[Warn]Skip {record_path} ({size} bytes): {reason}")
+        self.skipped.append((record_path, size, reason))
+
+    def __export_manifest(self):
+        """导出被跳过文件清单"""
+        with open(Path(self.__base_path) / f"{self.__name}-manifest.csv", mode="w", newline='') as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(["File", "Size", "Reason"])
+            writer.writerows(self.skipped)
 
 
 class AssignmentManager:
     """作业包处理类
     """
 
-    def __init__(self, lab_name):
+    def __init__(self, lab_name, cache: Optional[ResultCache] = None, journal: Optional[Journal] = None):
         self.__lab_name: str = lab_name
         self.__assignments: List[Assignment] = []
+        self.__keys: List[str] = []  # 各作业的缓存键
+        self.__cache: Optional[ResultCache] = cache  # 增量运行缓存
+        self.__journal: Optional[Journal] = journal  # 处理进度日志
 
     def __get_lab_num(self) -> str:
         """获取实验编号
         """
         return self.__lab_name[3:5]
 
-    def process_package(self, package: zipfile.ZipFile, stu_info: StudentInfo, output_path: PathLike[str] = "."):
+    @timed("process_package")
+    def process_package(self, package: zipfile.ZipFile, stu_info: StudentInfo, output_path: PathLike[str] = ".",
+                        workers: int = 1, check: Optional[AssignmentChecker] = None, id_pattern: str = ID_PATTERN):
         """导入并处理作业包
+        :param workers: 并行处理的进程数，大于1时各进程按路径重新打开作业包并处理分配到的学生作业
+        :param check: 文件忽略规则与解压限制，默认使用AssignmentChecker()
+        :param id_pattern: 从学生作业文件名提取学号的正则表达式，有分组时取第一个分组
         """
-        check = AssignmentChecker()
+        if check is None:
+            check = AssignmentChecker()
+        base_path = Path(f"{output_path}/{self.__lab_name}")
         print("[Info]Processing package..")
-        # 遍历所有学生作业
-        for file in package.filelist:
-            stu_num = file.filename[:13]  # 读取学生学号
-            try:
-                student: Student = Student(stu_num, stu_info[stu_num])  # 查询学生姓名缩写
-            except KeyError:
-                # 学生信息不存在
-                print(
-                    f"[Warn]Student shortname with number {stu_num} is not found in student list, ignored")
-                continue
-                # student = Student(stu_num, file.filename[14:-4])
+        # 解压前将所有学生作业与学生名单一次批量匹配，查询学生姓名缩写
+        pattern = re.compile(id_pattern)
+        members = [(file, student_id(file.filename, pattern)) for file in package.filelist]
+        names = stu_info.lookup({stu_num for _, stu_num in members if stu_num is not None})
+        jobs: List[Tuple[zipfile.ZipInfo, Student]] = []
+        unmatched: List[str] = []
+        for file, stu_num in members:
+            if stu_num in names:
+                jobs.append((file, Student(stu_num, names[stu_num])))
+            else:
+                unmatched.append(file.filename if stu_num is None else f"{file.filename} ({stu_num})")
+        if len(unmatched) > 0:
+            # 学生信息不存在
+            print(f"[Warn]{len(unmatched)} of {len(members)} members are not found in student list, ignored:")
+            for it in unmatched:
+                print(f"  {it}")
+
+        # 跳过上次中断前已处理完成的与缓存中未变化的学生作业
+        assignments: List[Optional[Assignment]] = [None] * len(jobs)
+        keys = [ResultCache.key(file) for file, _ in jobs]
+        pending: List[int] = []
+        restored: List[int] = []
+        for index, (file, student) in enumerate(jobs):
+            finished = self.__journal.get(keys[index]) if self.__journal is not None else None
+            if finished is not None:
+                assignment = Assignment(self.__get_lab_num(), student, base_path, check)
+                if not check.extract or len(finished[0]) == 0 or Path(assignment.src_path).exists():
+                    print("[Info]Assignment finished in the previous run:", student)
+                    assignment.source, assignment.report = finished[:2]
+                    assignment.filtered_count, assignment.filtered_bytes = finished[2]
+                    assignments[index] = assignment
+                    restored.append(index)
+                    continue
+            if self.__cache is not None:
+                cached = self.__cache.get_assignment(keys[index])
+                assignment = Assignment(self.__get_lab_num(), student, base_path, check)
+                if cached is not None and (not check.extract or len(cached[0]) == 0 or
+                                           Path(assignment.src_path).exists()):
+                    # 解压时确认上次的输出仍然存在
+                    print("[Info]Assignment unchanged:", student)
+                    assignment.source, assignment.report = cached
+                    assignments[index] = assignment
+                    continue
+                if check.extract:
+                    assignment.clean_output()  # 作业已变化，清除上次的输出
+            pending.append(index)
+
+        if workers > 1 and package.filename is None:
+            print("[Warn]Package is not opened from a path, fall back to sequential processing")
+            workers = 1
+
+        if workers <= 1:
+            for index in pending:
+                file, student = jobs[index]
+                # 处理单个学生作业
+                assignments[index] = process_member(package, file, self.__get_lab_num(), student, base_path, check)
+                self.__record(keys[index], assignments[index])
+        else:
+            # 按连续分片分配给各进程，结果按下标存放，保证作业顺序与串行处理一致
+            chunk = max(1, -(-len(pending) // (workers * 4)))
+            shares = [pending[i:i + chunk] for i in range(0, len(pending), chunk)]
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = {executor.submit(process_share, package.filename, self.__get_lab_num(), base_path, check,
+                                           [(jobs[i][0].filename, jobs[i][1]) for i in share],
+                                           PROFILER.enabled): number for number, share in enumerate(shares)}
+                logs: Dict[int, List[str]] = {}  # 已完成但尚未输出的分片日志
+                printed = 0  # 已输出日志的分片数
+                for future in as_completed(futures):
+                    number = futures[future]
+                    share_result, profile = future.result()
+                    if profile is not None:
+                        PROFILER.merge(profile)
+                    for index, (source, report, filtered, _) in zip(shares[number], share_result):
+                        assignment = Assignment(self.__get_lab_num(), jobs[index][1], base_path, check)
+                        assignment.source = source
+                        assignment.report = report
+                        assignment.filtered_count, assignment.filtered_bytes = filtered
+                        assignments[index] = assignment
+                        self.__record(keys[index], assignment)  # 分片完成即记录，中断时不丢失已完成的作业
+                    # 按分片顺序输出进程内缓存的日志，避免交错
+                    logs[number] = [log for _, _, _, log in share_result]
+                    while printed in logs:
+                        for log in logs.pop(printed):
+                            print(log, end="")
+                        printed += 1
+
+        filtered_count = sum(assignments[index].filtered_count for index in pending)
+        if filtered_count > 0:
+            filtered_bytes = sum(assignments[index].filtered_bytes for index in pending)
+            print(f"[Info]{filtered_count} members ({filtered_bytes} bytes) filtered before extraction")
+
+        self.__assignments += assignments
+        self.__keys += keys
+        if self.__cache is not None:
+            for index in pending + restored:
+                self.__cache.put_assignment(keys[index], assignments[index].source, assignments[index].report)
+            self.__cache.save()
+
+    def __record(self, key: str, assignment: Assignment):
+        """将处理完成的学生作业记录到进度日志"""
+        if self.__journal is not None:
+            self.__journal.record(key, assignment.source, assignment.report,
+                                  (assignment.filtered_count, assignment.filtered_bytes))
+
+    @timed("check")
+    def check(self, output_path: PathLike[str] = ".", exhaustive: bool = False, top_k: int = 0,
+              scores_path: Optional[PathLike[str]] = None, workers: int = 1):
+        """作业相似度检查
+        :param exhaustive: 为True时跳过候选对生成，两两穷举检查(用于验证候选结果)
+        :param workers: 逐对检查的进程数，大于1时作业对按分块并行检查，结果与串行检查相同
+        :param top_k: 大于0时导出每个作业综合相似度最高的top_k个作业
+        :param scores_path: 保存全部已检查作业对得分的路径，可用score.py按新的阈值重新导出报告
+        """
+        print("[Info]Assignments check..")
+        count = len(self.__assignments)
+        # 源码内容与实验报告内容相似度由指纹倒排索引直接得出，实验模板等公共内容被忽略
+        code_analyzer = CodeAnalyzer([it.source for it in self.__assignments])
+        document_analyzer = CodeAnalyzer([it.report for it in self.__assignments])
+        code_pairs = code_analyzer.similar_code()
+        document_pairs = document_analyzer.similar_code()
+        # 未达到阈值的重合比例只记录不低于最宽松阈值的部分，得分可按更低的阈值重新标记
+        code_overlaps = {pair: ratios for pair, ratios in code_analyzer.overlaps().items()
+                         if max(ratios) >= LOOSEST.overlap_ratio}
+        document_overlaps = {pair: ratios for pair, ratios in document_analyzer.overlaps().items()
+                             if max(ratios) >= LOOSEST.overlap_ratio}
+        # 共享相同文件(去除注释与空白后相同)的作业对由文件哈希索引直接得出
+        duplicate_pairs = DuplicateAnalyzer([it.source for it in self.__assignments]).duplicate_files()
+        sources = [it.source for it in self.__assignments]
+        report_keys = [(report_name_key(it), report_name_key(it, True)) for it in self.__assignments]
+        screen = FeatureScreen(sources)
+        if exhaustive:
+            pairs = [(index_l, index_r) for index_l in range(count - 1) for index_r in range(index_l + 1, count)]
+        else:
+            pairs = sorted(self.__candidate_pairs(screen, report_keys) | code_pairs.keys() |
+                           document_pairs.keys() | duplicate_pairs.keys())
+            print(f"[Info]{len(pairs)} candidate pairs generated from {count * (count - 1) // 2} pairs")
+        # 非候选的作业对直接视为不相似，候选对进行全部逐对检查
+        results: Dict[Tuple[int, int], Tuple[int, tuple]] = {}  # 作业对 -> (相似标记, 大小/结构/报告文件名得分)
+        jobs: List[Tuple[int, int]] = []  # 需要重新检查的作业对
+        for index_l, index_r in pairs:
+            cached = None
+            if self.__cache is not None and not exhaustive:
+                # 两份作业均未变化时复用上次结果
+                cached = self.__cache.get_pair(self.__keys[index_l], self.__keys[index_r])
+            if cached is not None:
+                results[(index_l, index_r)] = cached
+            else:
+                jobs.append((index_l, index_r))
+        for (index_l, index_r), result in zip(jobs, check_pairs(sources, report_keys, jobs, workers)):
+            results[(index_l, index_r)] = result
+            if self.__cache is not None:
+                self.__cache.put_pair(self.__keys[index_l], self.__keys[index_r], *result)
+
+        # 共享内容但未成为候选的作业对只记录内容得分，逐对检查的得分为None
+        rows: List[Tuple[int, int, int, tuple]] = []  # (左下标, 右下标, 相似标记, 各项得分)
+        for index_l, index_r in sorted(results.keys() | code_overlaps.keys() | document_overlaps.keys()):
+            flag, scores = results.get((index_l, index_r), (0b000, (None, None, None)))
+            if flag & 0b001:
+                print("[Warn]Similar upload file size")
+            if flag & 0b010:
+                print("[Warn]Similar file structure")
+            if flag & 0b100:
+                print(f"[Warn]Similar report filename")
+
+            if (index_l, index_r) in code_pairs:
+                print("[Warn]Similar source code")
+                flag |= 0b1000
+            scores += code_overlaps.get((index_l, index_r), (0.0, 0.0))
+
+            if (index_l, index_r) in document_pairs:
+                print("[Warn]Similar report content")
+                flag |= 0b10000
+            scores += document_overlaps.get((index_l, index_r), (0.0, 0.0))
+
+            if (index_l, index_r) in duplicate_pairs:
+                print("[Warn]Identical source files")
+                flag |= 0b100000
+            scores += duplicate_pairs.get((index_l, index_r), (0.0, 0.0))
+
+            scores += (screen.count_ratio(index_l, index_r), screen.extension_similarity(index_l, index_r))
+            rows.append((index_l, index_r, flag, scores))
+
+        # 导出相似度分析报告，存在雷同的作业对根据不同雷同情况分组
+        names = [f"{it.student}" for it in self.__assignments]
+        export_reports(names, rows, output_path, top_k)
+        if scores_path is not None:
+            save_scores(scores_path, names, [(index_l, index_r, scores) for index_l, index_r, _, scores in rows])
+        if len(code_pairs) > 0:
+            self.__export_code_report(code_pairs, output_path)
+        if self.__cache is not None:
+            self.__cache.save()
+
+    def check_corpus(self, corpus: Corpus, label: str, output_path: PathLike[str] = "."):
+        """与历史作业语料库比较源码内容相似度
+        :param label: 本实验包在语料库中的标签，同一标签的历史作业不参与比较
+        """
+        print(f"[Info]Corpus check against {len(corpus)} assignments..")
+        rows = []
+        for it in self.__assignments:
+            for index, l_ratio, r_ratio in corpus.query(it.source, label):
+                entry = corpus[index]
+                print(f"[Warn]Similar source code in corpus: {it.student} ~ {entry.label}/{entry.student}")
+                rows.append([f"{it.student}", entry.label, entry.student, f"{l_ratio:.1%}", f"{r_ratio:.1%}"])
+        if len(rows) > 0:
+            with open(Path(output_path) / "Similar Corpus Report.csv", mode="w", newline='') as csvfile:
+                writer = csv.writer(csvfile)
+                writer.writerow(["Student", "Corpus Label", "Corpus Student", "Overlap", "Corpus Overlap"])
+                writer.writerows(rows)
+
+    def update_corpus(self, corpus: Corpus, label: str):
+        """将本实验包的作业加入语料库(替换同一标签的历史作业)"""
+        corpus.update(label, [(f"{it.student}", it.source) for it in self.__assignments])
+
+    @timed("candidate_pairs")
+    def __candidate_pairs(self, screen: FeatureScreen, report_keys: List[Tuple[str, str]]) -> Set[Tuple[int, int]]:
+        """候选对生成
+        分别由特征矩阵筛选得到大小相似、可能结构相似(路径字符多重集合上界)与报告文件名可能相似(quick_ratio上界)的作业对，
+        各项筛选均不会遗漏相似对，每个候选对都进行全部逐对检查。
+        筛选使用score.LOOSEST中的最宽松阈值，保存的得分可在该范围内按新的阈值重新标记。
+        """
+        return (screen.size_pairs(LOOSEST.size_ratio).keys() | screen.structure_pairs(count_ratio=LOOSEST.count_ratio) |
+                screen.report_name_pairs(report_keys, LOOSEST.report_ratio))
+
+    def __export_code_report(self, code_pairs: Dict[Tuple[int, int], Tuple[float, float]], output_path: PathLike[str]):
+        """导出源码内容相似的作业对及其指纹重合比例"""
+        with open(Path(output_path) / "Similar Code Report.csv", mode="w", newline='') as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(["Student A", "Student B", "Overlap A", "Overlap B"])
+            for (index_l, index_r), (l_ratio, r_ratio) in sorted(code_pairs.items()):
+                writer.writerow([f"{self.__assignments[index_l].student}", f"{self.__assignments[index_r].student}",
+                                 f"{l_ratio:.1%}", f"{r_ratio:.1%}"])
+
+
+def process_member(package: zipfile.ZipFile, member: Union[str, zipfile.ZipInfo], lab_num: str, student: Student,
+                   base_path: Path, check: AssignmentChecker) -> Assignment:
+    """处理作业包中的单个学生作业"""
+    print("[Info]Processing Assignment:", student)
+
+    assignment = Assignment(lab_num, student, base_path, check)
+
+    with span("process_assignment", str(student)):
+        with package.open(member, mode='r') as package_io:
+            with zipfile.ZipFile(package_io, 'r') as assignment_zip:
+                assignment.process_assignment(assignment_zip)
+    count("assignments")
+    count("members_filtered", assignment.filtered_count)
+    count("bytes_filtered", assignment.filtered_bytes)
+    return assignment
+
+
+def process_share(package_path: str, lab_num: str, base_path: Path, check: AssignmentChecker,
+                  share: List[Tuple[str, Student]], profile: bool = False) \
+        -> Tuple[List[Tuple[Source, Report, Tuple[int, int], str]], Optional[tuple]]:
+    """在工作进程中处理一组学生作业
+    :param profile: 是否在工作进程中记录耗时
+    :return: 每个学生作业的源码信息、实验报告信息、被过滤的文件数与大小以及缓存的日志，工作进程的耗时记录
+    """
+    profile_worker(profile)
+    result = []
+    with zipfile.ZipFile(package_path, "r") as package:
+        for member, student in share:
+            log = io.StringIO()
+            with contextlib.redirect_stdout(log):
+                assignment = process_member(package, member, lab_num, student, base_path, check)
+            result.append((assignment.source, assignment.report,
+                           (assignment.filtered_count, assignment.filtered_bytes), log.getvalue()))
+    return result, profile_data()
+
+
+def check_pair(sources: List[Source], report_keys: List[Tuple[str, str]], index_l: int, index_r: int) \
+        -> Tuple[int, tuple]:
+    """检查一对作业的大小、结构与实验报告文件名相似度
+    :param report_keys: 各作业去除姓名学号后的实验报告文件名(姓名在前, 学号在前)
+    :return: 相似标记, (大小差异比, 结构相似比例, 报告文件名相似度)
+    """
+    flag = 0b000  # 相似位标记
+    src_analyzer = SourceAnalyzer(sources[index_l], sources[index_r])
+    size_score = src_analyzer.size_difference()
+    if src_analyzer.similar_size():
+        flag |= 0b001  # 记录
 
-            print("[Info]Processing Assignment:", student)
+    if src_analyzer.similar_structure():
+        flag |= 0b010
+    structure_score = src_analyzer.structure_ratio
 
-            # 处理单个学生作业
-            assignment = Assignment(self.__get_lab_num(), student, Path(f"{output_path}/{self.__lab_name}"), check)
+    # 实验报告文件相似度分析
+    report_score = difflib.SequenceMatcher(None, report_keys[index_l][0], report_keys[index_r][1]).ratio()
+    if report_score > REPORT_NAME_RATIO:
+        flag |= 0b100
+    return flag, (size_score, structure_score, report_score)
 
-            with package.open(file, mode='r') as package_io:
-                with zipfile.ZipFile(package_io, 'r') as assignment_zip:
-                    assignment.process_assignment(assignment_zip)
 
-            self.__assignments.append(assignment)
+_check_state: Optional[Tuple[List[Source], List[Tuple[str, str]]]] = None  # 检查进程共享的作业特征
 
-    def check(self, output_path: PathLike[str] = "."):
-        """作业相似度检查
-        """
-        print("[Info]Assignments check..")
-        similar_result: List[Tuple[int, List[int]]] = []  # 结果集
-        # 遍历两两检查
-        for index_l in range(len(self.__assignments) - 1):
-            left = self.__assignments[index_l]
-            l_src = left.source
-            for index_r in range(index_l + 1, len(self.__assignments)):
-                flag: int = 0b000  # 相似位标记
-                right = self.__assignments[index_r]
-                r_src = right.source
-                src_analyzer = SourceAnalyzer(l_src, r_src)
-                if src_analyzer.similar_size():
-                    print("[Warn]Similar upload file size")
-                    flag |= 0b001  # 记录
-
-                if src_analyzer.similar_structure():
-                    print("[Warn]Similar file structure")
-                    flag |= 0b010
-
-                # 实验报告文件相似度分析
-                # 去除报告中学生姓名学号
-                l_report_name = left.report.original_filename \
-                    .lower() \
-                    .replace(left.student.name.lower(), '') \
-                    .replace(left.student.num.lower(), '')
-                r_report_name = right.report.original_filename \
-                    .lower() \
-                    .replace(right.student.num.lower(), '') \
-                    .replace(right.student.name.lower(), '')
-                s = difflib.SequenceMatcher(None, l_report_name, r_report_name)
-                report_ratio = s.ratio()
-                if report_ratio > 0.8:
-                    print(f"[Warn]Similar report filename")
-                    flag |= 0b100
-
-                # 存在雷同，则根据不同雷同情况记录
-                if flag > 0:
-                    for f, indices in similar_result:
-                        if f == flag:
-                            find_l, find_r = False, False
-                            for it in indices:
-                                if it == index_l:
-                                    find_l = True
-                                elif it == index_r:
-                                    find_r = True
-                            if find_l and not find_r:
-                                indices.append(index_r)
-                                break
-                            elif find_l and find_r:
-                                break
-                    else:
-                        similar_result.append((flag, [index_l, index_r]))
-
-        # 导出相似度分析报告
-        if len(similar_result) > 0:
-            print("[Info]Exporting similar report..")
-            self.__export_check_report(similar_result, output_path)
-            print("[Info]Export finished.")
-
-    def __export_check_report(self, result: List[Tuple[int, List[int]]], output_path: PathLike[str]):
-        with open(Path(output_path) / "Similar Works Report.csv", mode="w", newline='') as csvfile:
-            writer = csv.writer(csvfile)
-            max_count = 0  # 确定表头大小
-            rows: List[str] = []
-            count = 1
-            for f, it in result:
-                if len(it) > max_count:
-                    max_count = len(it)
-                aspects = convert_flag(f)
-                rows += [[f"Group {count}", aspects] + [
-                    f"{self.__assignments[i].student}" for i in it]]
-                count += 1
-            header = ["", "Similar Aspects"] + [f"Student {i}" for i in range(1, max_count + 1)]  # 创建表头
-            writer.writerow(header)
-            writer.writerows(rows)
-
-
-def convert_flag(flag: int) -> str:
-    """转换flag成可读形式"""
-    kv_map = ["similar size, ", "similar structure, ", "similar report name"]
-    result = ""
-    index = 0
-    while flag > 0:
-        if flag % 2 == 1:
-            result += kv_map[index]
-        index += 1
-        flag >>= 1
-    return result
-
-
-def remove_single_src_dir(p: Path):
-    """移除单独出现的src目录"""
-    exist_src = False
-    count = 0
-    for sub in p.iterdir():
-        count += 1
-        if sub.is_dir():
-            if sub.name == "src":
-                exist_src = True
-            remove_single_src_dir(sub)
-    if exist_src and count == 1:
-        import shutil
-        src = (p / "src")
-        for sub in src.iterdir():
-            shutil.move(sub, p)
-        src.rmdir()
-
-
-def remove_single_begin_dir(p: Path, key: str):
-    """嵌套去除开头与关键词匹配的单文件夹"""
-    f = ""
-    for sub in p.iterdir():
-        # print(sub.name, key, difflib.SequenceMatcher(None, sub.name, key).ratio())
-        if sub.is_dir() and difflib.SequenceMatcher(None, sub.name, key).ratio() > 0.4:
-            f = sub.name
-        else:
-            return
-    # print(p, key, f)
-    if f != "":
-        si = (p / f)
-        st = (p / (f + "tmp"))
-        shutil.move(si, st)
-        for sub in st.iterdir():
-            shutil.move(sub, p)
-        st.rmdir()
-        remove_single_begin_dir(p, key)
-
-
-def get_archive_output_path(filename: str):
-    return separate_path_filename(decode_file_name(filename[:-4]))[1]
-
-
-def remove_duplicate_dir(p: Path):
-    """去除连续相同的单文件夹"""
-
-    count = 0
-    sub_dir: Union[Path, None] = None
-    for sub in p.iterdir():
-        if sub.is_dir():
-            sub_dir = sub
-            remove_duplicate_dir(sub)
-        count += 1
-
-    if count == 1 and sub_dir is not None and sub_dir.name == p.name:
-        st = (p / (sub_dir.name + "tmp"))
-        shutil.move(sub_dir, st)
-        for sub in st.iterdir():
-            shutil.move(sub, p)
-        st.rmdir()
+
+def init_check(sources: List[Source], report_keys: List[Tuple[str, str]], profile: bool = False):
+    """检查进程初始化，保存全部作业的特征供各分块使用"""
+    global _check_state
+    _check_state = (sources, report_keys)
+    profile_worker(profile)
+
+
+def check_tile(tile: List[Tuple[int, int]]) -> Tuple[List[Tuple[int, tuple]], Optional[tuple]]:
+    """在检查进程中检查一个分块内的作业对
+    :return: 各作业对的检查结果，本分块的耗时记录
+    """
+    sources, report_keys = _check_state
+    return [check_pair(sources, report_keys, *job) for job in tile], profile_data()
+
+
+def check_pairs(sources: List[Source], report_keys: List[Tuple[str, str]],
+                jobs: List[Tuple[int, int]], workers: int) -> List[Tuple[int, tuple]]:
+    """逐对检查大小、结构与实验报告文件名相似度，结果顺序与jobs相同
+    并行时作业对按下标划分为CHECK_TILE x CHECK_TILE的分块，同一分块只涉及少量作业，各进程的结构索引可以复用。
+    作业特征在进程启动时传递一次(支持fork时直接继承)，每个分块只传递作业对下标。
+    """
+    tiles: Dict[Tuple[int, int], List[Tuple[int, int]]] = {}
+    for job in jobs:
+        tiles.setdefault((job[0] // CHECK_TILE, job[1] // CHECK_TILE), []).append(job)
+    if workers <= 1 or len(tiles) <= 1:
+        return [check_pair(sources, report_keys, *job) for job in jobs]
+    tiles_list = list(tiles.values())
+    print(f"[Info]Checking {len(jobs)} pairs in {len(tiles_list)} tiles with {workers} processes")
+    context = multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else None
+    results: Dict[Tuple[int, int], Tuple[int, tuple]] = {}
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_check,
+                             initargs=(sources, report_keys, PROFILER.enabled)) as executor:
+        # 分块结果按作业对下标合并，与分块完成顺序及进程数无关
+        for tile, (tile_result, profile) in zip(tiles_list, executor.map(check_tile, tiles_list)):
+            if profile is not None:
+                PROFILER.merge(profile)
+            for job, result in zip(tile, tile_result):
+                results[(job[0], job[1])] = result
+    return [results[(job[0], job[1])] for job in jobs]
+
+
+def report_name_key(assignment: Assignment, num_first: bool = False) -> str:
+    """去除学生姓名学号后的实验报告文件名"""
+    name = assignment.report.original_filename.lower()
+    if num_first:
+        return name.replace(assignment.student.num.lower(), '').replace(assignment.student.name.lower(), '')
+    return name.replace(assignment.student.name.lower(), '').replace(assignment.student.num.lower(), '')
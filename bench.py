@@ -0,0 +1,305 @@
+import argparse
+import contextlib
+import csv
+import io
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+from typing import Callable, Dict, Optional, TypeVar
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from assignment import AssignmentManager, AssignmentChecker
+from student import StudentInfo
+
+LAB_NAME = "Lab03-Benchmark"
+ENCODINGS = ["utf-8", "gbk", "cp437"]
+# 各编码下可表示的非ASCII文件名片段
+NAME_SAMPLES = {"utf-8": "实验报告", "gbk": "实验报告", "cp437": "Übungsbericht"}
+
+
+class EncodedInfo(zipfile.ZipInfo):
+    """按指定编码写入文件名且不设置UTF-8标志位的ZipInfo，模拟Windows压缩软件生成的压缩包"""
+
+    def __init__(self, filename: str, encoding: str):
+        super().__init__(filename, (2021, 1, 1, 0, 0, 0))
+        self.compress_type = zipfile.ZIP_DEFLATED
+        self.encoding = encoding
+
+    def _encodeFilenameFlags(self):
+        if self.encoding == "utf-8":
+            return super()._encodeFilenameFlags()
+        return self.filename.encode(self.encoding), self.flag_bits
+
+
+def java_statement(rand: random.Random, depth: int = 0) -> str:
+    """生成一条结构随机的Java语句，使不同项目的源码分词后也各不相同"""
+    ops = ["+", "-", "*", "/", "%", "&", "|", "^"]
+    expr = f"value {rand.choice(ops)} {rand.randint(1, 99)}"
+    for _ in range(rand.randint(0, 3)):
+        expr = f"({expr}) {rand.choice(ops)} {rand.choice(['result', 'value', 'i'])}"
+    kind = rand.randint(0, 5 if depth < 2 else 2)
+    if kind == 0:
+        return f"result += {expr};"
+    elif kind == 1:
+        return f"result = Math.max(result, {expr});"
+    elif kind == 2:
+        return f"items.add(String.valueOf({expr}));"
+    elif kind == 3:
+        return f"if ({expr} > result) {{ {java_statement(rand, depth + 1)} }} else {{ result--; }}"
+    elif kind == 4:
+        return f"for (int i = 0; i < {rand.randint(2, 9)}; i++) {{ {java_statement(rand, depth + 1)} }}"
+    return f"while (result > {expr}) {{ result /= 2; {java_statement(rand, depth + 1)} }}"
+
+
+def java_class(rand: random.Random, name: str, methods: int) -> str:
+    """生成一个Java类"""
+    body = []
+    for i in range(methods):
+        statements = "\n".join(f"        {java_statement(rand)}" for _ in range(rand.randint(2, 8)))
+        body.append(f"    public int method{i}(int value, List<String> items) {{\n"
+                    f"        int result = 0; // step {i}\n"
+                    f"{statements}\n"
+                    f"        return result;\n"
+                    f"    }}\n")
+    return f"package com.lab;\n\nimport java.util.List;\n\n/**\n * {name}\n */\npublic class {name} {{\n" + \
+        "\n".join(body) + "}\n"
+
+
+def rename_identifiers(text: str, rand: random.Random) -> str:
+    """对抄袭副本做简单改写：重命名变量并修改注释"""
+    return text.replace("result", rand.choice(["res", "answer", "acc"])).replace("value", rand.choice(["x", "num"])) \
+        .replace("// step", "// line")
+
+
+def report_docx(rand: random.Random, paragraphs: int) -> bytes:
+    """生成最小的.docx实验报告：公共模板段落加随机正文"""
+    words = "测试用例覆盖率断言边界条件异常处理方法类接口实现结果分析总结重构依赖注入"
+    texts = ["实验目的：掌握JUnit单元测试的基本方法", "实验环境：JDK与IntelliJ IDEA", "实验步骤与结果"]
+    texts += ["".join(rand.choice(words) for _ in range(rand.randint(40, 120))) for _ in range(paragraphs)]
+    body = "".join(f"<w:p><w:r><w:t>{text}</w:t></w:r></w:p>" for text in texts)
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as docx:
+        docx.writestr(EncodedInfo("[Content_Types].xml", "utf-8"), "<Types/>")
+        docx.writestr(EncodedInfo("word/document.xml", "utf-8"), '<?xml version="1.0" encoding="UTF-8"?><w:document xmlns:w='
+                                           '"http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+                                           f"<w:body>{body}</w:body></w:document>")
+    return buffer.getvalue()
+
+
+def make_zip(files: Dict[str, bytes], encoding: str) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for path, content in files.items():
+            archive.writestr(EncodedInfo(path, encoding), content)
+    return buffer.getvalue()
+
+
+def make_rar(files: Dict[str, bytes], rar: str) -> bytes:
+    """调用rar命令行工具生成rar压缩包"""
+    with tempfile.TemporaryDirectory() as temp:
+        for path, content in files.items():
+            output = Path(temp) / "content" / path
+            output.parent.mkdir(parents=True, exist_ok=True)
+            output.write_bytes(content)
+        subprocess.run([rar, "a", "-r", "-idq", "-ep1", str(Path(temp) / "out.rar"), str(Path(temp) / "content") + os.sep],
+                       check=True)
+        return (Path(temp) / "out.rar").read_bytes()
+
+
+def generate_package(output_dir: Path, students: int, files: int, depth: int, clusters: int, cluster_size: int,
+                     use_rar: bool, seed: int) -> Dict[str, any]:
+    """生成合成的实验包与学生信息表
+    :param files: 每个项目的Java源文件数
+    :param depth: 项目压缩包的嵌套层数，0表示源码直接位于学生压缩包中
+    :param clusters: 抄袭簇数量，每簇cluster_size名学生共用改写后的同一份源码
+    :return: 实验包路径、学生信息表路径与生成统计
+    """
+    rand = random.Random(seed)
+    rar = shutil.which("rar") if use_rar else None
+    if use_rar and rar is None:
+        print("[Warn]rar is not found, nested rar archives are replaced by zip", file=sys.stderr)
+
+    nums = [f"2021{i:09d}" for i in range(students)]
+    names = [f"stu{i:04d}" for i in range(students)]
+    student_list = output_dir / "student-list.csv"
+    with open(student_list, "w", newline="") as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(["学号", "姓名", "姓名简称"])
+        for num, name in zip(nums, names):
+            writer.writerow([num, name.upper(), name])
+
+    # 抄袭簇：簇内学生使用同一份原始源码
+    cluster_of: Dict[int, int] = {}
+    members = rand.sample(range(students), min(students, clusters * cluster_size))
+    for position, index in enumerate(members):
+        cluster_of[index] = position // cluster_size
+
+    package_path = output_dir / f"{LAB_NAME}.zip"
+    source_bytes = 0
+    with zipfile.ZipFile(package_path, "w", zipfile.ZIP_STORED) as package:
+        for index in range(students):
+            encoding = ENCODINGS[index % len(ENCODINGS)]
+            project_rand = random.Random(f"{seed}-{cluster_of.get(index, -1 - index)}")
+            project = rand.choice(["Lab03", f"Lab03-{names[index]}", "JUnitLab"])
+            tree: Dict[str, bytes] = {}
+            for k in range(files):
+                text = java_class(project_rand, f"Class{k}", project_rand.randint(2, 12))
+                if index in cluster_of:
+                    text = rename_identifiers(text, rand)
+                tree[f"{project}/src/main/java/com/lab/Class{k}.java"] = text.encode("utf-8")
+            tree[f"{project}/pom.xml"] = b"<project>" + b"x" * rand.randint(100, 2000) + b"</project>"
+            tree[f"{project}/target/classes/com/lab/Class0.class"] = rand.randbytes(256)
+            tree[f"{project}/.idea/workspace.xml"] = b"<project/>"
+            source_bytes += sum(len(it) for it in tree.values())
+
+            # 逐层嵌套压缩包，启用rar时奇数层使用rar
+            for level in range(depth):
+                if rar is not None and level % 2 == 1:
+                    tree = {f"{project}-{level}.rar": make_rar(tree, rar)}
+                else:
+                    tree = {f"{project}-{level}.zip": make_zip(tree, encoding)}
+            tree[f"{nums[index]}{names[index]}{NAME_SAMPLES[encoding]}.docx"] = \
+                report_docx(project_rand, project_rand.randint(5, 30))
+            package.writestr(zipfile.ZipInfo(f"{nums[index]}-{names[index]}.zip", (2021, 1, 1, 0, 0, 0)),
+                             make_zip(tree, encoding))
+
+    return {
+        "package": str(package_path),
+        "student_list": str(student_list),
+        "package_bytes": package_path.stat().st_size,
+        "source_bytes": source_bytes,
+        "rar": rar is not None,
+    }
+
+
+T = TypeVar("T")
+
+
+def peak_rss() -> Optional[int]:
+    """当前进程与已结束子进程的峰值常驻内存(字节)"""
+    if resource is None:
+        return None
+    unit = 1 if sys.platform == "darwin" else 1024  # Linux下单位为KB
+    return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) * unit
+
+
+def in_child(task: Callable[[], T]) -> T:
+    """在fork出的子进程中执行task并取回结果，子进程的峰值内存从fork时开始统计，不包含之前阶段的占用
+    不支持fork时直接在当前进程中执行
+    """
+    if "fork" not in multiprocessing.get_all_start_methods():
+        return task()
+    context = multiprocessing.get_context("fork")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=lambda: sender.send(task()))
+    process.start()
+    sender.close()
+    try:
+        return receiver.recv()
+    except EOFError:  # 子进程异常退出，错误信息已输出到stderr
+        process.join()
+        raise RuntimeError(f"benchmark stage exited with code {process.exitcode}") from None
+    finally:
+        process.join()
+
+
+def measure(stage: Callable[[], None]) -> Dict[str, Optional[float]]:
+    """计时一个阶段，并记录本进程(从fork时开始)与其工作进程的峰值内存"""
+    start = time.perf_counter()
+    stage()
+    return {"seconds": time.perf_counter() - start, "peak_rss_bytes": peak_rss()}
+
+
+def run(package_path: str, student_list: str, output_path: Path, workers: int,
+        check: AssignmentChecker) -> Dict[str, float]:
+    """分别计时作业包处理与相似度检查，并分别记录两个阶段的峰值内存
+    作业包处理在子进程中进行，相似度检查在其再次fork出的子进程中进行，各阶段的峰值内存互不包含
+    """
+    def stages() -> Dict[str, float]:
+        manager = AssignmentManager(LAB_NAME)
+        info = StudentInfo(student_list)
+        with zipfile.ZipFile(package_path, "r") as package, contextlib.redirect_stdout(io.StringIO()):
+            processed = measure(lambda: manager.process_package(package, info, output_path, workers=workers,
+                                                                check=check))
+            checked = in_child(lambda: measure(lambda: manager.check(output_path)))
+        return {"process_seconds": processed["seconds"], "check_seconds": checked["seconds"],
+                "process_peak_rss_bytes": processed["peak_rss_bytes"],
+                "check_peak_rss_bytes": checked["peak_rss_bytes"]}
+
+    return in_child(stages)
+
+
+def compare(result: dict, baseline: dict):
+    """输出与基准结果的耗时对比"""
+    for key in ["process_seconds", "check_seconds", "process_peak_rss_bytes", "check_peak_rss_bytes"]:
+        old, new = baseline.get(key), result.get(key)
+        if old and new:
+            print(f"{key}: {old:.3f} -> {new:.3f} ({new / old - 1:+.1%})")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog="bench.py", description="NormLab性能基准测试")
+    parser.add_argument("-n", "--students", type=int, default=100, help="学生数量")
+    parser.add_argument("--files", type=int, default=20, help="每个项目的源文件数")
+    parser.add_argument("--depth", type=int, default=1, help="项目压缩包嵌套层数")
+    parser.add_argument("--clusters", type=int, default=5, help="抄袭簇数量")
+    parser.add_argument("--cluster-size", type=int, default=3, help="每个抄袭簇的学生数")
+    parser.add_argument("--rar", action="store_true", help="奇数嵌套层使用rar(需要rar命令行工具)")
+    parser.add_argument("-j", "--workers", type=int, default=1, help="并行处理作业包的进程数")
+    parser.add_argument("--seed", type=int, default=1, help="随机种子")
+    parser.add_argument("--work-dir", help="生成数据与输出目录(默认为临时目录，运行结束后删除)")
+    parser.add_argument("-o", "--output", help="结果JSON文件路径(默认输出到标准输出)")
+    parser.add_argument("--baseline", help="用于对比的基准结果JSON文件")
+    args = parser.parse_args()
+
+    with contextlib.ExitStack() as stack:
+        if args.work_dir is None:
+            work_dir = Path(stack.enter_context(tempfile.TemporaryDirectory()))
+        else:
+            work_dir = Path(args.work_dir)
+            work_dir.mkdir(parents=True, exist_ok=True)
+
+        stats = generate_package(work_dir, args.students, args.files, args.depth, args.clusters, args.cluster_size,
+                                 args.rar, args.seed)
+        output_path = work_dir / "output"
+        shutil.rmtree(output_path, ignore_errors=True)
+        output_path.mkdir()
+        timing = run(stats["package"], stats["student_list"], output_path, args.workers, AssignmentChecker())
+
+    pairs = args.students * (args.students - 1) // 2
+    mb = 1024 * 1024
+    result = {
+        "params": {key: getattr(args, key) for key in
+                   ["students", "files", "depth", "clusters", "cluster_size", "rar", "workers", "seed"]},
+        "package_bytes": stats["package_bytes"],
+        "source_bytes": stats["source_bytes"],
+        **timing,
+        "students_per_second": args.students / timing["process_seconds"],
+        "mb_per_second": stats["package_bytes"] / mb / timing["process_seconds"],
+        "pairs": pairs,
+        "pairs_per_second": pairs / timing["check_seconds"] if timing["check_seconds"] > 0 else None,
+        "python": sys.version.split()[0],
+    }
+    result["params"]["rar"] = stats["rar"]
+
+    text = json.dumps(result, indent=2)
+    if args.output is None:
+        print(text)
+    else:
+        Path(args.output).write_text(text)
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            compare(result, json.load(f))
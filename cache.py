@@ -0,0 +1,68 @@
+import os
+import pickle
+import zipfile
+from typing import Dict, Optional, Tuple
+
+from report import Report
+from source import Source
+
+CACHE_VERSION = 6  # 缓存格式或分析算法变化时递增
+
+
+class ResultCache:
+    """增量运行缓存
+    以作业包中学生作业文件的名称、CRC与大小为键，保存作业的源码信息、实验报告信息与两两检查结果。
+    再次运行时未变化的学生作业跳过解压，两者均未变化的作业对直接复用检查结果。
+    """
+
+    def __init__(self, path: os.PathLike[str], signature: tuple = ()):
+        self.__path = path
+        self.__signature = signature  # 处理规则，变化时缓存失效
+        self.__assignments: Dict[str, Tuple[Source, Report]] = {}
+        self.__pairs: Dict[Tuple[str, str], Tuple[int, tuple]] = {}  # 作业对 -> (相似标记, 各项得分)
+        self.__used: set = set()  # 本次运行中出现的键
+        if os.path.exists(path):
+            try:
+                with open(path, "rb") as f:
+                    data = pickle.load(f)
+            except (OSError, pickle.UnpicklingError, EOFError):
+                print("[Warn]Cache file is broken, ignored")
+                return
+            if data.get("version") == CACHE_VERSION and data.get("signature") == signature:
+                self.__assignments = data["assignments"]
+                self.__pairs = data["pairs"]
+            else:
+                print("[Info]Cache is outdated, rebuilding")
+
+    @staticmethod
+    def key(member: zipfile.ZipInfo) -> str:
+        """学生作业文件的缓存键"""
+        return f"{member.filename}:{member.CRC:08x}:{member.file_size}"
+
+    def get_assignment(self, key: str) -> Optional[Tuple[Source, Report]]:
+        self.__used.add(key)
+        return self.__assignments.get(key)
+
+    def put_assignment(self, key: str, source: Source, report: Report):
+        self.__used.add(key)
+        self.__assignments[key] = (source, report)
+
+    def get_pair(self, key_l: str, key_r: str) -> Optional[Tuple[int, tuple]]:
+        return self.__pairs.get((key_l, key_r) if key_l < key_r else (key_r, key_l))
+
+    def put_pair(self, key_l: str, key_r: str, flag: int, scores: tuple):
+        self.__pairs[(key_l, key_r) if key_l < key_r else (key_r, key_l)] = (flag, scores)
+
+    def save(self):
+        """写入缓存文件，只保留本次运行中出现的作业"""
+        used = self.__used
+        data = {
+            "version": CACHE_VERSION,
+            "signature": self.__signature,
+            "assignments": {k: v for k, v in self.__assignments.items() if k in used},
+            "pairs": {k: v for k, v in self.__pairs.items() if k[0] in used and k[1] in used},
+        }
+        temp = f"{self.__path}.tmp"
+        with open(temp, "wb") as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp, self.__path)  # 原子替换，避免中断时损坏缓存
@@ -0,0 +1,22 @@
+import bisect
+from typing import List, Set, Tuple
+
+
+def size_band_pairs(sizes: List[int], size_ratio: float) -> Set[Tuple[int, int]]:
+    """按大小分段生成候选对
+
+    SourceAnalyzer.similar_size要求 |a - b| 小于size_ratio乘以其中一方的大小，必然也小于size_ratio乘以较大一方，
+    因此只需在排序后的大小序列上对每个a寻找 b < a / (1 - size_ratio) 的区间，结果不会漏掉任何相似对。
+    """
+    order = sorted(range(len(sizes)), key=lambda x: sizes[x])
+    sorted_sizes = [sizes[x] for x in order]
+    result: Set[Tuple[int, int]] = set()
+    for pos, index in enumerate(order):
+        size = sorted_sizes[pos]
+        if size == 0:
+            continue
+        upper = size / (1 - size_ratio) * (1 + 1e-9)  # 放宽浮点误差
+        end = bisect.bisect_right(sorted_sizes, upper, pos + 1)
+        for other in order[pos + 1:end]:
+            result.add((index, other) if index < other else (other, index))
+    return result
@@ -0,0 +1,52 @@
+from typing import Dict, Iterable, List, Tuple
+
+
+class DisjointSet:
+    """并查集(路径压缩与按大小合并)"""
+
+    def __init__(self):
+        self.__parent: Dict[int, int] = {}
+        self.__size: Dict[int, int] = {}
+
+    def find(self, x: int) -> int:
+        parent = self.__parent
+        if x not in parent:
+            parent[x] = x
+            self.__size[x] = 1
+            return x
+        root = x
+        while parent[root] != root:
+            root = parent[root]
+        while parent[x] != root:  # 路径压缩
+            parent[x], x = root, parent[x]
+        return root
+
+    def union(self, x: int, y: int):
+        x, y = self.find(x), self.find(y)
+        if x == y:
+            return
+        if self.__size[x] < self.__size[y]:
+            x, y = y, x
+        self.__parent[y] = x
+        self.__size[x] += self.__size[y]
+
+    def groups(self) -> List[List[int]]:
+        """返回所有集合，集合内按下标排序，集合之间按最小下标排序"""
+        result: Dict[int, List[int]] = {}
+        for x in sorted(self.__parent):
+            result.setdefault(self.find(x), []).append(x)
+        return list(result.values())
+
+
+def group_pairs(edges: Iterable[Tuple[int, int, int]]) -> List[Tuple[int, List[int]]]:
+    """按相似标记分别对相似作业对进行传递闭包聚类
+    :param edges: (左下标, 右下标, 相似标记)
+    :return: (相似标记, 组内作业下标)，按组内最小下标与标记排序
+    """
+    sets: Dict[int, DisjointSet] = {}
+    for index_l, index_r, flag in edges:
+        if flag > 0:
+            sets.setdefault(flag, DisjointSet()).union(index_l, index_r)
+    result = [(flag, group) for flag, disjoint_set in sets.items() for group in disjoint_set.groups()]
+    result.sort(key=lambda it: (it[1][0], it[0]))
+    return result
@@ -0,0 +1,112 @@
+import os
+import pickle
+from typing import Dict, List, Optional, Tuple
+
+from source import Source
+
+CORPUS_VERSION = 3  # 语料库格式或指纹算法变化时递增
+
+
+class CorpusEntry:
+    """语料库中的一份历史作业"""
+
+    def __init__(self, label: str, student: str, source: Source):
+        self.label = label  # 所属实验包标签
+        self.student = student  # 学生(学号-姓名简称)
+        self.source = source  # 源码信息与内容指纹
+
+
+class Corpus:
+    """历史作业语料库
+    持久化保存已处理作业的源码信息与内容指纹，并以指纹倒排索引查询新作业，
+    与历史作业比较时无需重新解压或处理旧的实验包。
+    """
+
+    def __init__(self, path: os.PathLike[str]):
+        self.__path = path
+        self.__entries: List[CorpusEntry] = []
+        self.__index: Optional[Dict[int, List[int]]] = None  # 指纹 -> 作业下标(惰性构建)
+        self.__counts: List[int] = []  # 各历史作业的非公共指纹数
+        self.__limit = 0  # 公共指纹的作业数阈值
+        if os.path.exists(path):
+            try:
+                with open(path, "rb") as f:
+                    data = pickle.load(f)
+            except (OSError, pickle.UnpicklingError, EOFError):
+                print("[Warn]Corpus file is broken, ignored")
+                return
+            if data.get("version") == CORPUS_VERSION:
+                self.__entries = data["entries"]
+            else:
+                print("[Warn]Corpus is outdated, rebuilding")
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def __getitem__(self, item: int) -> CorpusEntry:
+        return self.__entries[item]
+
+    def labels(self) -> List[str]:
+        return sorted({entry.label for entry in self.__entries})
+
+    def update(self, label: str, entries: List[Tuple[str, Source]]):
+        """以一个实验包的全部作业替换语料库中同一标签的作业
+        :param entries: (学生, 源码信息)
+        """
+        self.__entries = [entry for entry in self.__entries if entry.label != label]
+        self.__entries += [CorpusEntry(label, student, source) for student, source in entries]
+        self.__index = None
+
+    def __build_index(self, common_ratio: float) -> Dict[int, List[int]]:
+        limit = max(2, int(len(self.__entries) * common_ratio))
+        if self.__index is None or self.__limit != limit:
+            self.__index = {}
+            for index, entry in enumerate(self.__entries):
+                for fingerprint in entry.source.fingerprints:
+                    self.__index.setdefault(fingerprint, []).append(index)
+            self.__limit = limit
+            self.__counts = [0] * len(self.__entries)
+            for indices in self.__index.values():
+                if len(indices) <= limit:
+                    for index in indices:
+                        self.__counts[index] += 1
+        return self.__index
+
+    def query(self, source: Source, exclude_label: str = "", overlap_ratio=0.5,
+              common_ratio=0.5) -> List[Tuple[int, float, float]]:
+        """查询与给定源码内容相似的历史作业
+        与CodeAnalyzer相同，出现在过多作业中的指纹被忽略，重合比例只统计非公共指纹。
+        :param exclude_label: 不参与比较的实验包标签(通常为正在检查的实验包本身)
+        :return: (语料库下标, 公共指纹占查询作业比例, 公共指纹占历史作业比例)，按重合比例降序
+        """
+        index = self.__build_index(common_ratio)
+        limit = self.__limit
+        shared: Dict[int, int] = {}
+        count = 0  # 查询作业的非公共指纹数
+        for fingerprint in source.fingerprints:
+            indices = index.get(fingerprint, ())
+            if len(indices) > limit:
+                continue
+            count += 1
+            for it in indices:
+                shared[it] = shared.get(it, 0) + 1
+
+        result = []
+        for it, common in shared.items():
+            entry = self.__entries[it]
+            if entry.label == exclude_label:
+                continue
+            l_ratio = common / count
+            r_ratio = common / self.__counts[it]
+            if max(l_ratio, r_ratio) >= overlap_ratio:
+                result.append((it, l_ratio, r_ratio))
+        result.sort(key=lambda x: (-max(x[1], x[2]), x[0]))
+        return result
+
+    def save(self):
+        """写入语料库文件"""
+        data = {"version": CORPUS_VERSION, "entries": self.__entries}
+        temp = f"{self.__path}.tmp"
+        with open(temp, "wb") as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp, self.__path)  # 原子替换，避免中断时损坏语料库
@@ -0,0 +1,74 @@
+import hashlib
+import io
+import re
+import zipfile
+from pathlib import Path
+from typing import Dict, Set
+from xml.etree import ElementTree
+
+from fingerprint import winnow
+
+_WORD_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+# 旧版.doc中的文本：UTF-16LE编码的ASCII或中日韩统一表意文字，以及8位ASCII
+_DOC_UTF16 = re.compile(rb"(?:[\x20-\x7e\t\r\n]\x00|[\x00-\xff][\x4e-\x9f]|[\x00-\xff]\x30|[\x00-\xff]\xff){4,}")
+_DOC_ASCII = re.compile(rb"[\x20-\x7e\t\r\n]{8,}")
+_NOT_WORD = re.compile(r"[\W_]+")
+
+# 文件内容哈希 -> 报告指纹，相同的报告(如直接复制的文件)只提取一次文本
+_FINGERPRINT_CACHE: Dict[str, Set[int]] = {}
+
+
+def docx_text(data: bytes) -> str:
+    """提取.docx正文文本(word/document.xml中的文本节点)"""
+    try:
+        with zipfile.ZipFile(io.BytesIO(data)) as docx:
+            root = ElementTree.fromstring(docx.read("word/document.xml"))
+    except (zipfile.BadZipFile, KeyError, ElementTree.ParseError):
+        return ""
+    paragraphs = []
+    for paragraph in root.iter(f"{_WORD_NS}p"):
+        paragraphs.append("".join(node.text or "" for node in paragraph.iter(f"{_WORD_NS}t")))
+    return "\n".join(paragraphs)
+
+
+def doc_text(data: bytes) -> str:
+    """启发式提取旧版.doc文本
+    不解析OLE复合文档结构，直接查找UTF-16LE与8位编码的连续可读文本片段，
+    可能混入少量样式名等非正文内容，对相似度比较影响不大。
+    """
+    # 几乎全部由可打印ASCII字节组成的片段是8位编码的文本，不按UTF-16解码
+    parts = [match.decode("utf-16-le", errors="ignore") for match in _DOC_UTF16.findall(data)
+             if sum(0x20 <= b < 0x7f for b in match) < len(match) * 0.9]
+    parts += [match.decode("ascii") for match in _DOC_ASCII.findall(data)]
+    return "\n".join(parts)
+
+
+def document_text(data: bytes, suffix: str) -> str:
+    """按后缀提取文档文本，不支持的格式返回空字符串"""
+    suffix = suffix.lower()
+    if suffix == ".docx":
+        return docx_text(data)
+    elif suffix == ".doc":
+        return doc_text(data)
+    return ""
+
+
+def text_fingerprints(text: str, k: int = 8, window: int = 8) -> Set[int]:
+    """去除空白与标点并转小写后，对字符k-gram进行winnowing"""
+    return winnow(list(_NOT_WORD.sub("", text).lower()), k, window)
+
+
+def report_fingerprints(path: Path) -> Set[int]:
+    """计算实验报告文件的内容指纹"""
+    with open(path, "rb") as f:
+        return report_data_fingerprints(f.read(), path.suffix)
+
+
+def report_data_fingerprints(data: bytes, suffix: str) -> Set[int]:
+    """计算实验报告内容的指纹，按内容哈希缓存"""
+    digest = hashlib.sha1(data).hexdigest()
+    fingerprints = _FINGERPRINT_CACHE.get(digest)
+    if fingerprints is None:
+        fingerprints = text_fingerprints(document_text(data, suffix))
+        _FINGERPRINT_CACHE[digest] = fingerprints
+    return fingerprints
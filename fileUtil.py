@@ -1,17 +1,206 @@
+import io
 import os
+import shutil
+import tempfile
+import threading
 import zipfile
+from concurrent.futures import Future, ThreadPoolExecutor
 import rarfile
-from typing import Union
+from typing import Union, Optional, IO, List, Set
+
+from profiler import span, count
+
+CHUNK_SIZE = 1024 * 1024  # 默认复制缓冲区大小
+UTF8_FLAG = 0x800  # zip文件名使用UTF-8编码的标志位
+NAME_SAMPLE = 64  # 检测文件名编码时采样的文件名数
+SPILL_SIZE = 16 * 1024 * 1024  # 默认嵌套压缩包内存缓冲上限，超过时写入临时文件
+WRITE_BUFFER = 64 * 1024 * 1024  # 默认后台写入队列中待写入数据的上限
+WRITE_FILE_LIMIT = 4 * 1024 * 1024  # 超过此大小的文件不经过后台写入，直接分块写入
+
+
+class FileSizeExceeded(Exception):
+    """解压时文件实际大小超过限制"""
+
+    def __init__(self, size: int, limit: int):
+        super().__init__(f"file size exceeds limit {limit}")
+        self.size = size  # 超出限制时已读取的大小
+        self.limit = limit
+
+
+class FileWriter:
+    """解压文件的后台写入
+    解压在调用方线程进行，解压后的文件内容交给线程池写入磁盘，等待磁盘写入时可继续解压后续文件。
+    待写入数据超过max_pending时提交阻塞(背压)，限制内存占用；超过file_limit的大文件不缓冲，由调用方直接分块写入。
+    目录在调用方线程按提交顺序创建并缓存，写入任务执行时所在目录必定已存在。
+    workers为0时所有文件同步写入。
+    """
+
+    def __init__(self, workers: int = 4, max_pending: int = WRITE_BUFFER, file_limit: int = WRITE_FILE_LIMIT):
+        self.__executor: Optional[ThreadPoolExecutor] = ThreadPoolExecutor(workers) if workers > 0 else None
+        self.__max_pending = max_pending
+        self.file_limit: int = file_limit if workers > 0 else 0  # 可缓冲后台写入的单个文件大小上限
+        self.__pending = 0  # 已提交、尚未写入的字节数
+        self.__condition = threading.Condition()
+        self.__futures: List[Future] = []
+        self.__dirs: Set[str] = set()  # 已创建的目录
+
+    def makedirs(self, path: str):
+        """创建目录，同一目录只调用一次os.makedirs"""
+        if path not in self.__dirs:
+            os.makedirs(path, exist_ok=True)
+            self.__dirs.add(path)
+
+    def write(self, target: str, chunks: List[bytes]):
+        """提交文件内容，所在目录需已通过makedirs创建"""
+        if self.__executor is None:
+            _write_chunks(target, chunks)
+            return
+        size = sum(len(it) for it in chunks)
+        with self.__condition:
+            while self.__pending > 0 and self.__pending + size > self.__max_pending:
+                count("write_behind_waits")
+                self.__condition.wait()
+            self.__pending += size
+        self.__futures.append(self.__executor.submit(self.__write_behind, target, chunks, size))
+
+    def __write_behind(self, target: str, chunks: List[bytes], size: int):
+        try:
+            _write_chunks(target, chunks)
+        finally:
+            with self.__condition:
+                self.__pending -= size
+                self.__condition.notify_all()
+
+    def wait(self):
+        """等待已提交的文件全部写入，写入出错时抛出第一个错误"""
+        futures, self.__futures = self.__futures, []
+        errors = [it.exception() for it in futures]
+        for error in errors:
+            if error is not None:
+                raise error
+
+    def close(self):
+        if self.__executor is not None:
+            try:
+                self.wait()
+            finally:
+                self.__executor.shutdown()
+
+    def __enter__(self) -> "FileWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        elif self.__executor is not None:  # 已有异常时只等待写入结束，不再抛出写入错误
+            self.__executor.shutdown()
+
+
+def _write_chunks(target: str, chunks: List[bytes]):
+    with open(target, 'wb') as io_output:
+        for chunk in chunks:
+            io_output.write(chunk)
 
 
 def extract_file(archive: Union[rarfile.RarFile, zipfile.ZipFile], name: any, output_path: os.PathLike[str],
-                 output_filename: str):
+                 output_filename: str, chunk_size: int = CHUNK_SIZE, max_size: Optional[int] = None,
+                 writer: Optional[FileWriter] = None, digest: any = None) -> int:
     """从压缩包中提取文件，并自动创建目录
+    以固定大小的缓冲区分块读取，超过max_size时删除已写入的部分并抛出FileSizeExceeded。
+    不超过writer.file_limit的文件读取完成后交给writer后台写入，调用方读取文件内容前需调用writer.wait()
+
+    :param writer: 未指定时同步写入
+    :param digest: 哈希对象，解压时以文件内容分块更新
+    :return: 写入的字节数
+    """
+    if writer is None:
+        writer = FileWriter(0)
+    with span("extract_file"):
+        writer.makedirs(output_path)  # 创建目录
+        target = f"{output_path}/{output_filename}"
+        written = 0
+        chunks = []  # 尚未写入的数据
+        io_output = None
+        try:
+            with archive.open(name, 'r') as io_input:
+                while True:
+                    chunk = io_input.read(chunk_size)
+                    if not chunk:
+                        break
+                    written += len(chunk)
+                    if max_size is not None and written > max_size:
+                        break
+                    if digest is not None:
+                        digest.update(chunk)
+                    chunks.append(chunk)
+                    if io_output is None and written > writer.file_limit:  # 大文件直接分块写入
+                        io_output = open(target, 'wb')
+                    if io_output is not None:
+                        for it in chunks:
+                            io_output.write(it)
+                        chunks = []
+        finally:
+            if io_output is not None:
+                io_output.close()
+        if max_size is not None and written > max_size:
+            if io_output is not None:
+                os.remove(target)
+            raise FileSizeExceeded(written, max_size)
+        if io_output is None:
+            writer.write(target, chunks)
+    count("files_extracted")
+    count("bytes_extracted", written)
+    return written
+
+
+def read_file(archive: Union[rarfile.RarFile, zipfile.ZipFile], name: any, chunk_size: int = CHUNK_SIZE,
+              max_size: Optional[int] = None, digest: any = None, keep: bool = True) -> bytes:
+    """从压缩包中读取文件内容(不写入磁盘)，超过max_size时抛出FileSizeExceeded
+    :param digest: 哈希对象，读取时以文件内容分块更新
+    :param keep: 为False时不保留读取的内容(只计算哈希)，返回空字节串
     """
-    os.makedirs(output_path, exist_ok=True)  # 创建目录
-    with archive.open(name, 'r') as io_input:
-        with open(f"{output_path}/{output_filename}", 'wb') as io_output:
-            io_output.write(io_input.read())
+    with span("read_file"):
+        chunks = []
+        read = 0
+        with archive.open(name, 'r') as io_input:
+            while True:
+                chunk = io_input.read(chunk_size)
+                if not chunk:
+                    break
+                read += len(chunk)
+                if max_size is not None and read > max_size:
+                    raise FileSizeExceeded(read, max_size)
+                if digest is not None:
+                    digest.update(chunk)
+                if keep:
+                    chunks.append(chunk)
+    count("files_read")
+    count("bytes_read", read)
+    return b"".join(chunks)
+
+
+def open_nested_archive(archive: Union[rarfile.RarFile, zipfile.ZipFile], name: any,
+                        spill_size: int = SPILL_SIZE, chunk_size: int = CHUNK_SIZE) -> IO[bytes]:
+    """将嵌套压缩包完整解压一次到可随机访问的缓冲区
+    压缩包内的文件需要随机访问，直接在解压流上打开会导致反复解压。
+    不超过spill_size的压缩包读入内存，否则写入临时文件，调用方负责关闭返回的文件对象。
+    """
+    count("nested_archives")
+    count("nested_archive_bytes", name.file_size)
+    with span("open_nested_archive"):
+        if name.file_size <= spill_size:
+            with archive.open(name, 'r') as io_input:
+                return io.BytesIO(io_input.read())
+        count("nested_archives_spilled")
+        buffer = tempfile.TemporaryFile()
+        try:
+            with archive.open(name, 'r') as io_input:
+                shutil.copyfileobj(io_input, buffer, chunk_size)
+        except BaseException:
+            buffer.close()
+            raise
+        buffer.seek(0)
+        return buffer
 
 
 def get_output_path(path: str, key: str) -> str:
@@ -28,12 +217,8 @@ def get_output_path(path: str, key: str) -> str:
 def separate_path_filename(path: str) -> (str, str):
     """分离路径和文件名 返回(路径, 文件名)
     """
-    index = path.find("/")
-    current = index
-    while not index == -1:
-        current = index
-        index = path.find("/", current + 1)
-    return path[:current], path[current + 1:]
+    directory, _, filename = path.rpartition("/")
+    return directory, filename
 
 
 def decode_file_name(name: str) -> str:
@@ -43,6 +228,9 @@ def decode_file_name(name: str) -> str:
         e = name.encode("cp437")
         e = e.decode("utf-8")
         return e
+    except UnicodeEncodeError:
+        # 设置了UTF-8标志位的文件名已被正确解码
+        return name
     except UnicodeDecodeError:
         try:
             e = name.encode("cp437")
@@ -50,3 +238,45 @@ def decode_file_name(name: str) -> str:
             return e
         except UnicodeDecodeError:
             return name
+
+
+def detect_name_encoding(samples: List[bytes]) -> Optional[str]:
+    """以采样的原始文件名检测编码
+    :return: 全部能以UTF-8解码时为UTF-8，全部不能时为GBK，混合编码时返回None
+    """
+    valid = 0
+    for data in samples:
+        try:
+            data.decode("utf-8")
+            valid += 1
+        except UnicodeDecodeError:
+            pass
+    if valid == len(samples):
+        return "utf-8"
+    return "gbk" if valid == 0 else None
+
+
+def decode_file_names(files: List[any]) -> List[str]:
+    """批量解码压缩包内的文件名，去除中文乱码
+    每个压缩包只检测一次编码：设置了UTF-8标志位或纯ASCII的文件名无需处理，其余文件名合并后一次还原为原始字节，
+    取样检测编码后一次解码。合并处理失败时(如个别文件名编码不同)逐个按decode_file_name处理。
+
+    :return: 与files一一对应的文件名
+    """
+    result = [file.filename for file in files]
+    pending = [index for index, file in enumerate(files)
+               if not (result[index].isascii() or getattr(file, "flag_bits", 0) & UTF8_FLAG)]
+    if len(pending) == 0:
+        return result
+    decoded = None
+    try:
+        encoding = detect_name_encoding([result[index].encode("cp437") for index in pending[:NAME_SAMPLE]])
+        if encoding is not None:
+            decoded = "\0".join(result[index] for index in pending).encode("cp437").decode(encoding).split("\0")
+    except UnicodeError:
+        pass
+    if decoded is None:
+        decoded = [decode_file_name(result[index]) for index in pending]
+    for index, name in zip(pending, decoded):
+        result[index] = name
+    return result
@@ -0,0 +1,143 @@
+import hashlib
+import re
+import zlib
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+# 按文件后缀注册的分词器，分词结果中标识符、字面量与注释均已被规范化或去除
+TOKENIZERS: Dict[str, Callable[..., List[str]]] = {}
+# 按文件后缀注册的规范化函数，将保留原文的分词结果转换为规范化的分词结果
+NORMALIZERS: Dict[str, Callable[[List[str]], List[str]]] = {}
+
+
+def register_tokenizer(suffixes: Iterable[str], tokenizer: Callable[..., List[str]],
+                       normalizer: Optional[Callable[[List[str]], List[str]]] = None):
+    """为指定后缀(如".java")注册分词器
+    分词器的normalize参数为False时只去除注释，保留标识符与字面量原文
+    :param normalizer: 由保留原文的分词结果得到规范化分词结果的函数，提供时每个文件只需分词一次
+    """
+    for suffix in suffixes:
+        TOKENIZERS[suffix.lower()] = tokenizer
+        if normalizer is not None:
+            NORMALIZERS[suffix.lower()] = normalizer
+
+
+JAVA_KEYWORDS = {
+    "abstract", "assert", "boolean", "break", "byte", "case", "catch", "char", "class", "const", "continue",
+    "default", "do", "double", "else", "enum", "extends", "final", "finally", "float", "for", "goto", "if",
+    "implements", "import", "instanceof", "int", "interface", "long", "native", "new", "package", "private",
+    "protected", "public", "return", "short", "static", "strictfp", "super", "switch", "synchronized", "this",
+    "throw", "throws", "transient", "try", "void", "volatile", "while", "var", "record", "true", "false", "null",
+}
+
+_JAVA_TOKEN = re.compile(r'//[^\n]*|/\*.*?(?:\*/|$)|"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'|[A-Za-z_$][\w$]*'
+                         r'|\d[\w.]*|\S', re.S)
+
+
+def tokenize_java(text: str, normalize: bool = True) -> List[str]:
+    """Java分词：去除注释，标识符统一为V，字符串/字符/数字字面量分别统一为S/C/N，保留关键字与符号"""
+    tokens = [token for token in _JAVA_TOKEN.findall(text) if not token.startswith("//") and not token.startswith("/*")]
+    return normalize_java(tokens) if normalize else tokens
+
+
+def normalize_java(tokens: List[str]) -> List[str]:
+    """规范化去除注释后的Java分词结果"""
+    result = []
+    for token in tokens:
+        first = token[0]
+        if first == '"':
+            result.append("S")
+        elif first == "'":
+            result.append("C")
+        elif first.isdigit():
+            result.append("N")
+        elif first.isalpha() or first in "_$":
+            result.append(token if token in JAVA_KEYWORDS else "V")
+        else:
+            result.append(token)
+    return result
+
+
+register_tokenizer([".java"], tokenize_java, normalize_java)
+
+
+def get_tokenizer(filename: str) -> Optional[Callable[[str], List[str]]]:
+    """根据文件后缀获取分词器，不支持的语言返回None"""
+    index = filename.rfind(".")
+    if index == -1:
+        return None
+    return TOKENIZERS.get(filename[index:].lower())
+
+
+def get_normalizer(filename: str) -> Optional[Callable[[List[str]], List[str]]]:
+    """根据文件后缀获取规范化函数，未注册时返回None"""
+    index = filename.rfind(".")
+    if index == -1:
+        return None
+    return NORMALIZERS.get(filename[index:].lower())
+
+
+def winnow(tokens: List[str], k: int = 10, window: int = 5) -> Set[int]:
+    """计算k-gram哈希并进行winnowing，返回选中的指纹集合
+    长度不少于 k + window - 1 个token的相同片段保证至少产生一个相同的指纹。
+    """
+    if len(tokens) < k:
+        return set()
+    hashes = [zlib.crc32(" ".join(tokens[i:i + k]).encode("utf-8")) for i in range(len(tokens) - k + 1)]
+    if len(hashes) <= window:
+        return {min(hashes)}
+    result: Set[int] = set()
+    selected = -1
+    for start in range(len(hashes) - window + 1):
+        if selected < start:
+            # 上次选中的位置已移出窗口，重新寻找窗口内最右侧的最小值
+            selected = start
+            for pos in range(start + 1, start + window):
+                if hashes[pos] <= hashes[selected]:
+                    selected = pos
+            result.add(hashes[selected])
+        elif hashes[start + window - 1] <= hashes[selected]:
+            selected = start + window - 1
+            result.add(hashes[selected])
+    return result
+
+
+def fingerprint_text(text: str, filename: str) -> Optional[Set[int]]:
+    """计算源码文本的指纹集合，不支持的语言返回None"""
+    tokenizer = get_tokenizer(filename)
+    if tokenizer is None:
+        return None
+    return winnow(tokenizer(text))
+
+
+def content_digest():
+    """文件内容哈希(可分块update)，结果由digest_value转换为整数"""
+    return hashlib.blake2b(digest_size=8)
+
+
+def digest_value(digest) -> int:
+    return int.from_bytes(digest.digest(), "big")
+
+
+def normalized_hash(text: str, filename: str) -> Optional[int]:
+    """去除注释与空白后的源码内容哈希，只有格式或注释不同的文件结果相同，不支持的语言返回None"""
+    tokenizer = get_tokenizer(filename)
+    if tokenizer is None:
+        return None
+    digest = content_digest()
+    digest.update(" ".join(tokenizer(text, normalize=False)).encode("utf-8"))
+    return digest_value(digest)
+
+
+def fingerprint_source(text: str, filename: str) -> Optional[Tuple[Set[int], int]]:
+    """同时计算源码文本的指纹集合与去除注释、空白后的哈希，与fingerprint_text、normalized_hash的结果相同
+    注册了规范化函数的语言只分词一次，由保留原文的分词结果得到规范化分词结果。
+    :return: (指纹集合, 去除注释与空白后的哈希)，不支持的语言返回None
+    """
+    tokenizer = get_tokenizer(filename)
+    if tokenizer is None:
+        return None
+    tokens = tokenizer(text, normalize=False)
+    digest = content_digest()
+    digest.update(" ".join(tokens).encode("utf-8"))
+    normalizer = get_normalizer(filename)
+    return winnow(normalizer(tokens) if normalizer is not None else tokenizer(text)), digest_value(digest)
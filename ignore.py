@@ -0,0 +1,117 @@
+import re
+from typing import Dict, Iterable, List, Optional
+
+# 默认忽略规则(gitignore语法)
+DEFAULT_PATTERNS = [
+    ".git/",
+    ".idea/",
+    "target/",
+    "__MACOSX/",
+    "*.class",
+    ".gitignore",
+    ".DS_Store",
+]
+
+
+def translate(pattern: str) -> str:
+    """将gitignore风格的模式转换为匹配相对路径的正则表达式
+    不含斜杠(末尾除外)的模式匹配任意一级的文件/目录名，含斜杠的模式从作业根目录开始匹配。
+    """
+    anchored = "/" in pattern.rstrip("/")
+    body = pattern.strip("/")
+    result = []
+    i = 0
+    while i < len(body):
+        ch = body[i]
+        if body.startswith("**/", i):
+            result.append("(?:.*/)?")
+            i += 3
+            continue
+        elif body.startswith("**", i):
+            result.append(".*")
+            i += 2
+            continue
+        elif ch == "*":
+            result.append("[^/]*")
+        elif ch == "?":
+            result.append("[^/]")
+        elif ch == "[":
+            end = body.find("]", i + 2)
+            if end == -1:
+                result.append(re.escape(ch))
+            else:
+                chars = body[i + 1:end]
+                if chars[0] == "!":
+                    chars = "^" + chars[1:]
+                result.append(f"[{chars.replace(chr(92), chr(92) * 2)}]")
+                i = end
+        elif ch == "\\" and i + 1 < len(body):
+            i += 1
+            result.append(re.escape(body[i]))
+        else:
+            result.append(re.escape(ch))
+        i += 1
+    return ("" if anchored else "(?:.*/)?") + "".join(result)
+
+
+def load_patterns(path: str) -> List[str]:
+    """读取忽略规则文件，忽略空行与#开头的注释"""
+    patterns = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\r\n")
+            if line.strip() == "" or line.startswith("#"):
+                continue
+            patterns.append(line.rstrip())
+    return patterns
+
+
+def _compile(regexes: List[str]) -> Optional["re.Pattern"]:
+    if len(regexes) == 0:
+        return None
+    return re.compile("|".join(f"(?:{it})" for it in regexes), re.S)
+
+
+class IgnoreMatcher:
+    """编译后的忽略规则
+    全部规则合并为一个正则表达式，目录的判断结果按目录路径缓存，
+    被忽略目录下的文件只需一次字典查询即可跳过。以!开头的模式重新包含被匹配的文件/目录，
+    但与gitignore相同，被忽略目录下的内容不能被重新包含。
+    """
+
+    def __init__(self, patterns: Iterable[str]):
+        dir_ignore, dir_keep, file_ignore, file_keep = [], [], [], []
+        for pattern in patterns:
+            negate = pattern.startswith("!")
+            if negate:
+                pattern = pattern[1:]
+            regex = translate(pattern)
+            (dir_keep if negate else dir_ignore).append(regex)
+            if not pattern.endswith("/"):  # 末尾为斜杠的模式只匹配目录
+                (file_keep if negate else file_ignore).append(regex)
+        self.__dir_ignore = _compile(dir_ignore)
+        self.__dir_keep = _compile(dir_keep)
+        self.__file_ignore = _compile(file_ignore)
+        self.__file_keep = _compile(file_keep)
+        self.__dirs: Dict[str, bool] = {"": False}  # 目录路径 -> 是否被忽略
+
+    def ignored_dir(self, path: str) -> bool:
+        """目录(或其任意上级目录)是否被忽略"""
+        result = self.__dirs.get(path)
+        if result is None:
+            if len(self.__dirs) > 65536:  # 限制缓存大小
+                self.__dirs = {"": False}
+            result = self.ignored_dir(path.rpartition("/")[0]) or \
+                (self.__dir_ignore is not None and self.__dir_ignore.fullmatch(path) is not None and
+                 (self.__dir_keep is None or self.__dir_keep.fullmatch(path) is None))
+            self.__dirs[path] = result
+        return result
+
+    def ignored_file(self, path: str) -> bool:
+        """文件本身是否被忽略(不检查所在目录)"""
+        return self.__file_ignore is not None and self.__file_ignore.fullmatch(path) is not None and \
+            (self.__file_keep is None or self.__file_keep.fullmatch(path) is None)
+
+    def ignored(self, path: str) -> bool:
+        """文件(以作业根目录为起点的相对路径)是否被忽略"""
+        return self.ignored_dir(path.rpartition("/")[0]) or self.ignored_file(path)
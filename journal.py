@@ -0,0 +1,66 @@
+import os
+import pickle
+from typing import Dict, Optional, Tuple
+
+from report import Report
+from source import Source
+
+JOURNAL_VERSION = 1  # 日志格式变化时递增
+
+
+class Journal:
+    """作业包处理进度日志
+    每处理完一份学生作业追加一条记录(缓存键、源码信息、实验报告信息与被过滤的文件数/大小)并立即写入磁盘，
+    运行中断后重新运行时跳过已完成的学生作业。记录逐条追加，中断时写了一半的最后一条记录在读取时被丢弃。
+    """
+
+    def __init__(self, path: os.PathLike[str], signature: tuple = ()):
+        self.__path = path
+        self.__entries: Dict[str, Tuple[Source, Report, Tuple[int, int]]] = {}
+        header = {"version": JOURNAL_VERSION, "signature": signature}  # 处理规则变化时日志失效
+        valid = 0  # 完整记录的结束位置
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                try:
+                    if pickle.load(f) == header:
+                        valid = f.tell()
+                        while True:
+                            key, source, report, filtered = pickle.load(f)
+                            self.__entries[key] = (source, report, filtered)
+                            valid = f.tell()
+                except (pickle.UnpicklingError, EOFError, ValueError, TypeError):
+                    pass
+            if valid == 0:
+                print("[Info]Journal is outdated or broken, ignored")
+        self.__file = open(path, "r+b" if valid > 0 else "wb")
+        if valid > 0:
+            self.__file.truncate(valid)
+            self.__file.seek(valid)
+            print(f"[Info]Journal loaded: {len(self.__entries)} assignments finished in the previous run")
+        else:
+            self.__append(header)
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def get(self, key: str) -> Optional[Tuple[Source, Report, Tuple[int, int]]]:
+        return self.__entries.get(key)
+
+    def record(self, key: str, source: Source, report: Report, filtered: Tuple[int, int]):
+        """记录处理完成的学生作业"""
+        self.__entries[key] = (source, report, filtered)
+        self.__append((key, source, report, filtered))
+
+    def __append(self, item: any):
+        # 单条记录一次写入并同步到磁盘
+        self.__file.write(pickle.dumps(item, protocol=pickle.HIGHEST_PROTOCOL))
+        self.__file.flush()
+        os.fsync(self.__file.fileno())
+
+    def close(self, remove: bool = False):
+        """关闭日志
+        :param remove: 全部处理完成后删除日志文件
+        """
+        self.__file.close()
+        if remove:
+            os.remove(self.__path)
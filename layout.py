@@ -0,0 +1,109 @@
+import difflib
+from typing import Dict, Iterator, Optional, Tuple, Union
+
+
+class LayoutFile:
+    """目录规划中的文件节点，记录文件来源"""
+
+    def __init__(self, archive: any, info: any, record_path: str, index: int = -1):
+        self.archive = archive  # 所在压缩包
+        self.info = info  # 压缩包文件句柄
+        self.record_path = record_path  # 源码记录中的相对路径
+        self.index = index  # 在源码记录中的下标，实验报告为-1
+
+
+class LayoutDir:
+    """目录规划中的目录节点
+    在内存中构建作业的输出目录树，应用目录整理规则后再一次性解压到最终位置
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.children: Dict[str, Union[LayoutDir, LayoutFile]] = {}
+
+    def __len__(self) -> int:
+        return len(self.children)
+
+    def find(self, parts: Tuple[str, ...]) -> Optional["LayoutDir"]:
+        """查找子目录，不存在时返回None"""
+        node = self
+        for part in parts:
+            node = node.children.get(part)
+            if not isinstance(node, LayoutDir):
+                return None
+        return node
+
+    def add_file(self, parts: Tuple[str, ...], file: LayoutFile):
+        """按相对路径添加文件，自动创建中间目录"""
+        node = self
+        for part in parts[:-1]:
+            child = node.children.get(part)
+            if not isinstance(child, LayoutDir):
+                child = LayoutDir(part)
+                node.children[part] = child
+            node = child
+        node.children[parts[-1]] = file
+
+    def merge(self, other: "LayoutDir"):
+        """将另一目录的内容移动到本目录下，同名目录递归合并"""
+        for name, child in other.children.items():
+            current = self.children.get(name)
+            if isinstance(current, LayoutDir) and isinstance(child, LayoutDir):
+                current.merge(child)
+            else:
+                self.children[name] = child
+
+    def walk(self, prefix: Tuple[str, ...] = ()) -> Iterator[Tuple[Tuple[str, ...], str, LayoutFile]]:
+        """遍历所有文件
+        :return: (目录相对路径, 文件名, 文件节点)
+        """
+        for name, child in self.children.items():
+            if isinstance(child, LayoutDir):
+                yield from child.walk(prefix + (name,))
+            else:
+                yield prefix, name, child
+
+
+def split_path(path: str) -> Tuple[str, ...]:
+    """拆分相对路径，去除空路径段与当前目录"""
+    return tuple(part for part in path.split("/") if part not in ("", "."))
+
+
+def remove_single_src_dir(p: LayoutDir):
+    """移除单独出现的src目录"""
+    for sub in list(p.children.values()):
+        if isinstance(sub, LayoutDir):
+            remove_single_src_dir(sub)
+    src = p.children.get("src")
+    if len(p) == 1 and isinstance(src, LayoutDir):
+        del p.children["src"]
+        p.merge(src)
+
+
+def remove_single_begin_dir(p: LayoutDir, key: str):
+    """嵌套去除开头与关键词匹配的单文件夹"""
+    while True:
+        f: Optional[LayoutDir] = None
+        for sub in p.children.values():
+            if isinstance(sub, LayoutDir) and difflib.SequenceMatcher(None, sub.name, key).ratio() > 0.4:
+                f = sub
+            else:
+                return
+        if f is None:
+            return
+        del p.children[f.name]
+        p.merge(f)
+
+
+def remove_duplicate_dir(p: LayoutDir):
+    """去除连续相同的单文件夹"""
+    sub_dir: Optional[LayoutDir] = None
+    for sub in list(p.children.values()):
+        if isinstance(sub, LayoutDir):
+            sub_dir = sub
+            remove_duplicate_dir(sub)
+
+    if len(p) == 1 and sub_dir is not None and sub_dir.name == p.name:
+        del p.children[sub_dir.name]
+        p.merge(sub_dir)
+
@@ -1,19 +1,103 @@
-import sys
+import argparse
 import zipfile
 from pathlib import Path
 
-from assignment import AssignmentManager
-from student import StudentInfo
+from assignment import AssignmentManager, AssignmentChecker
+from cache import ResultCache
+from corpus import Corpus
+from ignore import load_patterns
+from journal import Journal
+from profiler import PROFILER
+from student import StudentInfo, ID_PATTERN
 
 if __name__ == '__main__':
-    if len(sys.argv) != 3:
-        print(f"Usage:\npython normlab.py <student list> <Lab package>")
-        exit(0)
-    student_list_path = sys.argv[1]
-    package_path = Path(sys.argv[2])
-
-    info_dict = StudentInfo(student_list_path)
-    manager = AssignmentManager(package_path.name[:-len(package_path.suffix)])
-    with zipfile.ZipFile(package_path, "r") as package:
-        manager.process_package(package, info_dict)
-        manager.check()
+    parser = argparse.ArgumentParser(prog="normlab.py", description="作业规范化与相似度分析")
+    parser.add_argument("student_list", help="学生信息表")
+    parser.add_argument("package", nargs="+", help="系统导出的实验包，可指定多个")
+    parser.add_argument("--student-index", metavar="PATH",
+                        help="学生信息表的SQLite索引文件(不存在或信息表变化时重建)，用于很大的、多门课程共用的学生名单")
+    parser.add_argument("--id-pattern", default=ID_PATTERN, metavar="REGEX",
+                        help="从学生作业文件名提取学号的正则表达式，有分组时取第一个分组(默认为文件名的前13个字符，学号只含数字时可用^\\d+)")
+    parser.add_argument("-j", "--workers", type=int, default=1, help="并行处理作业包与逐对相似度检查的进程数")
+    parser.add_argument("--chunk-size", type=int, default=1024, help="解压缓冲区大小(KB)")
+    parser.add_argument("--write-threads", type=int, default=4, help="后台写入解压文件的线程数，为0时同步写入")
+    parser.add_argument("--no-extract", action="store_true", help="不解压作业，只输出相似度检查报告")
+    parser.add_argument("--max-file-size", type=int, help="单个文件大小上限(MB)，超过的文件将被跳过并记录")
+    parser.add_argument("--max-total-size", type=int, help="单份作业解压总大小上限(MB)")
+    parser.add_argument("--ignore-file", metavar="PATH", help="追加的忽略规则文件(gitignore语法)")
+    parser.add_argument("--cache", nargs="?", const="", metavar="PATH",
+                        help="启用增量运行缓存，未变化的学生作业跳过解压与重复比较(默认为<实验名>.cache)")
+    parser.add_argument("--no-journal", action="store_true",
+                        help="不记录处理进度(默认记录到<实验名>.journal，中断后重新运行时跳过已处理完成的学生作业)")
+    parser.add_argument("--exhaustive", action="store_true", help="两两穷举相似度检查(不使用候选对生成)")
+    parser.add_argument("--top-k", type=int, default=0, metavar="K", help="导出每个作业综合相似度最高的K个作业")
+    parser.add_argument("--save-scores", action="store_true",
+                        help="保存全部已检查作业对的得分，可用score.py按新的阈值重新导出报告")
+    parser.add_argument("--corpus", metavar="PATH", help="历史作业语料库，检查后将本次的实验包加入语料库")
+    parser.add_argument("--corpus-label", default="", metavar="PREFIX",
+                        help="实验包在语料库中的标签前缀(如学期)，用于区分不同学期的同名实验")
+    parser.add_argument("--profile", nargs="?", const="", metavar="PATH",
+                        help="记录各处理阶段耗时并输出热点与最慢的作业，指定路径时导出记录数据")
+    parser.add_argument("--profile-format", choices=["json", "chrome"], default="json",
+                        help="耗时记录导出格式(chrome为Chrome Trace格式)")
+    args = parser.parse_args()
+
+    # 输出目录、相似度报告、进度日志与缓存均以实验包文件名命名，同名实验包会互相覆盖
+    lab_names = [Path(it).name[:-len(Path(it).suffix)] for it in args.package]
+    duplicates = sorted({it for it in lab_names if lab_names.count(it) > 1})
+    if len(duplicates) > 0:
+        parser.error(f"packages with the same name would overwrite each other's output: {', '.join(duplicates)}")
+
+    if args.profile is not None:
+        PROFILER.enable()
+
+    student_list_path = args.student_list
+
+    mb = 1024 * 1024
+    checker = AssignmentChecker(args.max_file_size * mb if args.max_file_size is not None else None,
+                                args.max_total_size * mb if args.max_total_size is not None else None,
+                                args.chunk_size * 1024,
+                                ignore_patterns=load_patterns(args.ignore_file) if args.ignore_file else None,
+                                write_workers=args.write_threads, extract=not args.no_extract)
+
+    shared_cache = None  # 指定缓存路径时所有实验包共用一个缓存
+    if args.cache:
+        shared_cache = ResultCache(args.cache, checker.signature())
+
+    corpus = None
+    if args.corpus is not None:
+        corpus = Corpus(args.corpus)
+        print(f"[Info]Corpus loaded: {len(corpus)} assignments from {len(corpus.labels())} packages")
+
+    info_dict = StudentInfo(student_list_path, args.student_index)
+    for package_name, lab_name in zip(args.package, lab_names):
+        package_path = Path(package_name)
+        cache = shared_cache
+        if args.cache == "":
+            cache = ResultCache(f"{lab_name}.cache", checker.signature())
+        # 多个实验包时相似度报告输出到各自的实验目录，避免互相覆盖
+        report_path = Path(lab_name) if len(args.package) > 1 else Path(".")
+        report_path.mkdir(exist_ok=True)
+
+        journal = None if args.no_journal else Journal(f"{lab_name}.journal", checker.signature())
+        manager = AssignmentManager(lab_name, cache, journal)
+        with zipfile.ZipFile(package_path, "r") as package:
+            manager.process_package(package, info_dict, workers=args.workers, check=checker,
+                                    id_pattern=args.id_pattern)
+            manager.check(report_path, exhaustive=args.exhaustive, top_k=args.top_k,
+                          scores_path=report_path / "Similar Scores.db" if args.save_scores else None,
+                          workers=args.workers)
+        if corpus is not None:
+            label = f"{args.corpus_label}/{lab_name}" if args.corpus_label else lab_name
+            manager.check_corpus(corpus, label, report_path)
+            manager.update_corpus(corpus, label)
+        if journal is not None:
+            journal.close(remove=True)  # 检查完成后不再需要进度日志
+
+    if corpus is not None:
+        corpus.save()
+
+    if args.profile is not None:
+        PROFILER.print_summary()
+        if args.profile:
+            PROFILER.export(args.profile, chrome=args.profile_format == "chrome")
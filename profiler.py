@@ -0,0 +1,159 @@
+import contextlib
+import functools
+import json
+import os
+import statistics
+import time
+from typing import Dict, List, Optional, Tuple
+
+_NULL = contextlib.nullcontext()
+
+
+class Profiler:
+    """耗时区间与计数器记录
+    未启用时span返回共享的空上下文，对各处理流程几乎没有额外开销。
+    """
+
+    def __init__(self):
+        self.enabled: bool = False
+        self.spans: List[Tuple[str, str, float, float, int]] = []  # (名称, 参数, 开始时间(秒), 耗时(秒), 进程号)
+        self.counters: Dict[str, int] = {}
+
+    def enable(self):
+        self.enabled = True
+
+    def span(self, name: str, arg: str = ""):
+        """记录with语句块的耗时
+        :param arg: 附加信息，如学生
+        """
+        if not self.enabled:
+            return _NULL
+        return self.__span(name, arg)
+
+    @contextlib.contextmanager
+    def __span(self, name: str, arg: str):
+        start = time.time()
+        begin = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.spans.append((name, arg, start, time.perf_counter() - begin, os.getpid()))
+
+    def count(self, name: str, value: int = 1):
+        """累加计数器"""
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def drain(self) -> Tuple[list, Dict[str, int]]:
+        """取出并清空已记录的数据(用于从工作进程传回主进程)"""
+        data = (self.spans, self.counters)
+        self.spans, self.counters = [], {}
+        return data
+
+    def merge(self, data: Tuple[list, Dict[str, int]]):
+        """合并工作进程记录的数据"""
+        spans, counters = data
+        self.spans += spans
+        for name, value in counters.items():
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def hotspots(self, top: int = 10) -> List[Tuple[str, int, float, float]]:
+        """按总耗时排序的区间统计
+        :return: (名称, 次数, 总耗时, 最大耗时)
+        """
+        stats: Dict[str, List[float]] = {}
+        for name, _, _, duration, _ in self.spans:
+            stats.setdefault(name, []).append(duration)
+        result = [(name, len(it), sum(it), max(it)) for name, it in stats.items()]
+        result.sort(key=lambda x: -x[2])
+        return result[:top]
+
+    def outliers(self, name: str = "process_assignment", top: int = 5) -> List[Tuple[str, float, float]]:
+        """指定区间中耗时最长的几项
+        :return: (参数, 耗时, 耗时与中位数之比)
+        """
+        durations = [(arg, duration) for span_name, arg, _, duration, _ in self.spans if span_name == name]
+        if len(durations) == 0:
+            return []
+        median = statistics.median(duration for _, duration in durations)
+        durations.sort(key=lambda x: -x[1])
+        return [(arg, duration, duration / median if median > 0 else 0.0) for arg, duration in durations[:top]]
+
+    def print_summary(self, top: int = 10):
+        print("[Info]Profile hot spots:")
+        for name, count, total, longest in self.hotspots(top):
+            print(f"  {name:<40} {count:>8} calls {total:>10.3f}s total {longest:>9.3f}s max")
+        outliers = self.outliers()
+        if len(outliers) > 0:
+            print("[Info]Slowest assignments:")
+            for arg, duration, ratio in outliers:
+                print(f"  {arg:<40} {duration:>10.3f}s ({ratio:.1f}x median)")
+        if len(self.counters) > 0:
+            print("[Info]Profile counters:")
+            for name, value in sorted(self.counters.items()):
+                print(f"  {name:<40} {value:>12}")
+
+    def export(self, path: str, chrome: bool = False):
+        """导出记录数据
+        :param chrome: 为True时导出Chrome Trace格式(可在chrome://tracing或Perfetto中查看)
+        """
+        if chrome:
+            events = [{"name": name, "ph": "X", "ts": start * 1e6, "dur": duration * 1e6, "pid": pid, "tid": pid,
+                       "args": {"arg": arg} if arg else {}}
+                      for name, arg, start, duration, pid in self.spans]
+            events += [{"name": name, "ph": "C", "ts": 0, "pid": os.getpid(), "args": {name: value}}
+                       for name, value in self.counters.items()]
+            data = {"traceEvents": events, "displayTimeUnit": "ms"}
+        else:
+            data = {
+                "hotspots": [{"name": name, "count": count, "total": total, "max": longest}
+                             for name, count, total, longest in self.hotspots(top=len(self.spans))],
+                "outliers": [{"arg": arg, "duration": duration, "ratio": ratio}
+                             for arg, duration, ratio in self.outliers(top=20)],
+                "counters": self.counters,
+                "spans": [{"name": name, "arg": arg, "start": start, "duration": duration, "pid": pid}
+                          for name, arg, start, duration, pid in self.spans],
+            }
+        with open(path, "w") as f:
+            json.dump(data, f)
+
+
+PROFILER = Profiler()  # 全局记录器，由normlab.py --profile启用
+
+
+def span(name: str, arg: str = ""):
+    """PROFILER.span的简写"""
+    return PROFILER.span(name, arg)
+
+
+def timed(name: str):
+    """记录函数每次调用耗时的装饰器"""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with PROFILER.span(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def count(name: str, value: int = 1):
+    """PROFILER.count的简写"""
+    PROFILER.count(name, value)
+
+
+def profile_worker(enabled: bool):
+    """在工作进程中开始记录
+    fork启动的工作进程继承了主进程已记录的数据，先清空，否则传回主进程合并时会被重复计数
+    """
+    if enabled:
+        PROFILER.drain()
+        PROFILER.enable()
+
+
+def profile_data() -> Optional[Tuple[list, Dict[str, int]]]:
+    """工作进程中取出记录的数据，未启用时返回None"""
+    return PROFILER.drain() if PROFILER.enabled else None
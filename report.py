@@ -1,11 +1,17 @@
+from typing import Set
+
+
 class Report:
     """实验报告类
     """
 
+    __slots__ = ("original_filename", "file_size", "count", "fingerprints")
+
     def __init__(self, filename: str = "", file_size: int = -1):
         self.original_filename = filename
         self.file_size = file_size
         self.count = 0
+        self.fingerprints: Set[int] = set()  # 报告正文内容指纹
 
     def cmp_update(self, filename: str, file_size: int) -> bool:
         """比较与更新
@@ -0,0 +1,240 @@
+import argparse
+import csv
+import heapq
+import sqlite3
+from os import PathLike
+from pathlib import Path
+from typing import List, Tuple
+
+from cluster import group_pairs
+
+SCORES_VERSION = 2  # 得分数据库格式变化时递增
+REPORT_NAME_RATIO = 0.8  # 实验报告文件名相似度阈值
+
+# 作业对各项得分(未检查的项为None)，与Similar Pairs Report.csv的得分列一一对应
+SCORE_COLUMNS = ["Size Difference", "Structure Ratio", "Report Name Ratio", "Code Overlap A", "Code Overlap B",
+                 "Report Overlap A", "Report Overlap B", "Identical Files A", "Identical Files B",
+                 "File Count Ratio", "Extension Similarity"]
+ASPECTS = ["similar size", "similar structure", "similar report name", "similar code", "similar report content",
+           "identical files"]
+
+
+class Thresholds:
+    """由各项得分判断相似方面的阈值，默认值与检查时使用的阈值相同"""
+
+    def __init__(self, size_ratio: float = 0.10, count_ratio: float = 0.6, report_ratio: float = REPORT_NAME_RATIO,
+                 overlap_ratio: float = 0.5):
+        self.size_ratio = size_ratio  # 相似大小比阈值
+        self.count_ratio = count_ratio  # 结构相似文件占比阈值
+        self.report_ratio = report_ratio  # 实验报告文件名相似度阈值
+        self.overlap_ratio = overlap_ratio  # 源码与报告内容指纹重合比例阈值
+
+    def flag(self, scores: tuple) -> int:
+        """相似位标记，与AssignmentManager.check的标记方式相同"""
+        size, structure, report, code_l, code_r, document_l, document_r, identical_l, identical_r = scores[:9]
+        flag = 0
+        if size is not None and size < self.size_ratio:
+            flag |= 0b1
+        if structure is not None and structure > self.count_ratio:
+            flag |= 0b10
+        if report is not None and report > self.report_ratio:
+            flag |= 0b100
+        if code_l is not None and max(code_l, code_r) >= self.overlap_ratio:
+            flag |= 0b1000
+        if document_l is not None and max(document_l, document_r) >= self.overlap_ratio:
+            flag |= 0b10000
+        if identical_l is not None and max(identical_l, identical_r) > 0:
+            flag |= 0b100000
+        return flag
+
+    def within(self, limits: "Thresholds") -> bool:
+        """各项阈值均不比limits宽松，即按limits保存的得分足以按本阈值重新标记"""
+        return self.size_ratio <= limits.size_ratio and self.count_ratio >= limits.count_ratio and \
+            self.report_ratio >= limits.report_ratio and self.overlap_ratio >= limits.overlap_ratio
+
+    def __str__(self) -> str:
+        return f"--size-ratio {self.size_ratio} --count-ratio {self.count_ratio} " \
+               f"--report-ratio {self.report_ratio} --overlap-ratio {self.overlap_ratio}"
+
+
+# 检查时按最宽松的阈值生成候选对并保存内容重合比例，重新标记时阈值不能比它更宽松
+LOOSEST = Thresholds(size_ratio=0.15, count_ratio=0.5, report_ratio=0.7, overlap_ratio=0.3)
+
+
+def similarity(scores: tuple) -> float:
+    """综合相似度，用于排序
+    大小差异转换为1-差异，内容重合比例取两侧较大值，与结构、报告文件名得分取平均，未检查的项记为0
+    """
+    size, structure, report, code_l, code_r, document_l, document_r, identical_l, identical_r = scores[:9]
+    values = [max(0.0, 1 - size) if size is not None else 0.0, structure or 0.0, report or 0.0,
+              max(code_l, code_r) if code_l is not None else 0.0,
+              max(document_l, document_r) if document_l is not None else 0.0,
+              max(identical_l, identical_r) if identical_l is not None else 0.0]
+    return sum(values) / len(values)
+
+
+def convert_flag(flag: int) -> str:
+    """转换flag成可读形式"""
+    result = []
+    index = 0
+    while flag > 0:
+        if flag % 2 == 1:
+            result.append(ASPECTS[index])
+        index += 1
+        flag >>= 1
+    return ", ".join(result)
+
+
+def top_partners(count: int, rows: List[Tuple[int, int, tuple]], k: int) -> List[List[Tuple[float, int]]]:
+    """每个作业综合相似度最高的k个作业，以大小为k的最小堆维护
+    :return: 各作业的(综合相似度, 作业下标)，按相似度从高到低排序
+    """
+    heaps: List[List[Tuple[float, int]]] = [[] for _ in range(count)]
+    for index_l, index_r, scores in rows:
+        value = similarity(scores)
+        for index, partner in ((index_l, index_r), (index_r, index_l)):
+            heap = heaps[index]
+            if len(heap) < k:
+                heapq.heappush(heap, (value, -partner))
+            elif (value, -partner) > heap[0]:
+                heapq.heapreplace(heap, (value, -partner))
+    return [[(value, -partner) for value, partner in sorted(heap, reverse=True)] for heap in heaps]
+
+
+def save_scores(path: PathLike[str], names: List[str], rows: List[Tuple[int, int, tuple]],
+                limits: Thresholds = LOOSEST):
+    """保存全部已检查作业对的得分(SQLite)，覆盖已有文件
+    :param limits: 得分覆盖的最宽松阈值，超出任一阈值的作业对不必保存
+    """
+    path = Path(path)
+    temp = path.with_name(path.name + ".tmp")
+    temp.unlink(missing_ok=True)
+    connection = sqlite3.connect(temp)
+    try:
+        columns = ", ".join(f"s{i} REAL" for i in range(len(SCORE_COLUMNS)))
+        connection.execute("CREATE TABLE meta (version INTEGER, size_ratio REAL, count_ratio REAL, report_ratio REAL, "
+                           "overlap_ratio REAL)")
+        connection.execute("CREATE TABLE students (id INTEGER PRIMARY KEY, name TEXT)")
+        connection.execute(f"CREATE TABLE pairs (a INTEGER, b INTEGER, {columns})")
+        connection.execute("INSERT INTO meta VALUES (?, ?, ?, ?, ?)", (SCORES_VERSION, limits.size_ratio,
+                                                                      limits.count_ratio, limits.report_ratio,
+                                                                      limits.overlap_ratio))
+        connection.executemany("INSERT INTO students VALUES (?, ?)", enumerate(names))
+        marks = ", ".join("?" * (len(SCORE_COLUMNS) + 2))
+        connection.executemany(f"INSERT INTO pairs VALUES ({marks})",
+                               ((index_l, index_r) + tuple(scores) for index_l, index_r, scores in rows))
+        connection.commit()
+    finally:
+        connection.close()
+    temp.replace(path)
+
+
+def load_scores(path: PathLike[str]) -> Tuple[List[str], List[Tuple[int, int, tuple]]]:
+    """读取save_scores保存的得分
+    :return: 学生列表, (左下标, 右下标, 各项得分)
+    """
+    connection = sqlite3.connect(path)
+    try:
+        _read_meta(connection)
+        names = [name for name, in connection.execute("SELECT name FROM students ORDER BY id")]
+        rows = [(row[0], row[1], tuple(row[2:])) for row in connection.execute("SELECT * FROM pairs ORDER BY a, b")]
+    finally:
+        connection.close()
+    return names, rows
+
+
+def load_limits(path: PathLike[str]) -> Thresholds:
+    """读取save_scores保存的得分所覆盖的最宽松阈值"""
+    connection = sqlite3.connect(path)
+    try:
+        return Thresholds(*_read_meta(connection)[1:])
+    finally:
+        connection.close()
+
+
+def _read_meta(connection: sqlite3.Connection) -> tuple:
+    """读取得分数据库的格式版本与阈值范围"""
+    meta = connection.execute("SELECT * FROM meta").fetchone()
+    if meta[0] != SCORES_VERSION:
+        raise ValueError(f"unsupported scores version {meta[0]}")
+    return meta
+
+
+def export_reports(names: List[str], rows: List[Tuple[int, int, int, tuple]], output_path: PathLike[str],
+                   top_k: int = 0):
+    """导出相似作业分组、相似作业对及各作业最相似的top_k个作业
+    :param rows: (左下标, 右下标, 相似标记, 各项得分)，包含所有已检查的作业对
+    """
+    edges = [row for row in rows if row[2] > 0]
+    # 相同雷同情况的作业对按传递关系聚类成组
+    similar_result = group_pairs((index_l, index_r, flag) for index_l, index_r, flag, _ in edges)
+    if len(similar_result) > 0:
+        print("[Info]Exporting similar report..")
+        export_works_report(names, similar_result, output_path)
+        export_pair_report(names, edges, output_path)
+        print("[Info]Export finished.")
+    if top_k > 0:
+        export_top_report(names, [(index_l, index_r, scores) for index_l, index_r, _, scores in rows], top_k,
+                          output_path)
+
+
+def export_works_report(names: List[str], result: List[Tuple[int, List[int]]], output_path: PathLike[str]):
+    with open(Path(output_path) / "Similar Works Report.csv", mode="w", newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        max_count = 0  # 确定表头大小
+        rows: List[str] = []
+        count = 1
+        for f, it in result:
+            if len(it) > max_count:
+                max_count = len(it)
+            aspects = convert_flag(f)
+            rows += [[f"Group {count}", aspects] + [names[i] for i in it]]
+            count += 1
+        header = ["", "Similar Aspects"] + [f"Student {i}" for i in range(1, max_count + 1)]  # 创建表头
+        writer.writerow(header)
+        writer.writerows(rows)
+
+
+def export_pair_report(names: List[str], edges: List[Tuple[int, int, int, tuple]], output_path: PathLike[str]):
+    """导出相似作业对及各项得分(未检查的项留空)"""
+    with open(Path(output_path) / "Similar Pairs Report.csv", mode="w", newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(["Student A", "Student B", "Similar Aspects"] + SCORE_COLUMNS)
+        for index_l, index_r, flag, scores in edges:
+            writer.writerow([names[index_l], names[index_r], convert_flag(flag)] +
+                            ["" if it is None else f"{it:.1%}" for it in scores])
+
+
+def export_top_report(names: List[str], rows: List[Tuple[int, int, tuple]], k: int, output_path: PathLike[str]):
+    """导出每个作业综合相似度最高的k个作业"""
+    partners = top_partners(len(names), rows, k)
+    with open(Path(output_path) / "Top Similar Report.csv", mode="w", newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(["Student", "Rank", "Similar Student", "Similarity"])
+        for index, it in enumerate(partners):
+            for rank, (value, partner) in enumerate(it, 1):
+                writer.writerow([names[index], rank, names[partner], f"{value:.1%}"])
+
+
+def rescore(rows: List[Tuple[int, int, tuple]], thresholds: Thresholds) -> List[Tuple[int, int, int, tuple]]:
+    """按新的阈值重新标记已保存的作业对"""
+    return [(index_l, index_r, thresholds.flag(scores), scores) for index_l, index_r, scores in rows]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog="score.py", description="按新的阈值重新导出相似度报告")
+    parser.add_argument("scores", help="检查时保存的得分文件(normlab.py --save-scores)")
+    parser.add_argument("-o", "--output", default=".", help="报告输出目录")
+    parser.add_argument("--size-ratio", type=float, default=0.10, help="相似大小比阈值")
+    parser.add_argument("--count-ratio", type=float, default=0.6, help="结构相似文件占比阈值")
+    parser.add_argument("--report-ratio", type=float, default=REPORT_NAME_RATIO, help="实验报告文件名相似度阈值")
+    parser.add_argument("--overlap-ratio", type=float, default=0.5, help="源码与报告内容指纹重合比例阈值")
+    parser.add_argument("--top-k", type=int, default=0, help="导出每个作业最相似的K个作业")
+    args = parser.parse_args()
+
+    thresholds = Thresholds(args.size_ratio, args.count_ratio, args.report_ratio, args.overlap_ratio)
+    score_limits = load_limits(args.scores)
+    if not thresholds.within(score_limits):
+        parser.error(f"thresholds are looser than the saved scores support ({score_limits})")
+    student_names, score_rows = load_scores(args.scores)
+    export_reports(student_names, rescore(score_rows, thresholds), args.output, args.top_k)
@@ -0,0 +1,225 @@
+import math
+from collections import Counter
+from typing import Dict, List, Set, Tuple
+
+from candidate import size_band_pairs
+from profiler import timed
+from source import Source
+
+try:
+    import numpy
+except ImportError:  # 未安装numpy时使用纯Python实现，结果相同
+    numpy = None
+
+BLOCK_SIZE = 1024  # 分块计算时每块的行数，限制中间矩阵的内存占用
+BLOCK_ELEMENTS = 1 << 24  # 分块计算时中间数组的元素数上限
+
+
+def _extension(path: str) -> str:
+    name = path[path.rfind("/") + 1:]
+    index = name.rfind(".")
+    return name[index:].lower() if index > 0 else ""
+
+
+class FeatureScreen:
+    """作业低成本特征的两两筛选
+    将源码大小、文件数与文件后缀分布打包为数组，大小相似检查以分块的N×N矩阵运算一次完成，
+    文件数比与后缀分布相似度作为结构比较结果的参考得分。
+    """
+
+    def __init__(self, sources: List[Source], extensions: int = 16):
+        self.sizes: List[int] = [it.size for it in sources]
+        self.counts: List[int] = [len(it) for it in sources]
+        self.__paths: List[List[str]] = [list(it) for it in sources]
+        # 后缀分布：取出现最多的若干种后缀，其余归为一类，每行归一化为单位向量
+        histograms: List[Dict[str, int]] = []
+        total: Dict[str, int] = {}
+        for source in sources:
+            histogram: Dict[str, int] = {}
+            for file in source:
+                suffix = _extension(file)
+                histogram[suffix] = histogram.get(suffix, 0) + 1
+                total[suffix] = total.get(suffix, 0) + 1
+            histograms.append(histogram)
+        columns = sorted(total, key=lambda x: (-total[x], x))[:extensions]
+        column_of = {suffix: index for index, suffix in enumerate(columns)}
+        self.histograms: List[List[float]] = []
+        for histogram in histograms:
+            row = [0.0] * (len(columns) + 1)
+            for suffix, value in histogram.items():
+                row[column_of.get(suffix, len(columns))] += value
+            norm = math.sqrt(sum(x * x for x in row))
+            self.histograms.append([x / norm for x in row] if norm > 0 else row)
+        if numpy is not None:
+            self.__histograms = numpy.array(self.histograms, dtype=numpy.float64)
+
+    @timed("FeatureScreen.size_pairs")
+    def size_pairs(self, size_ratio: float) -> Dict[Tuple[int, int], float]:
+        """大小相似的作业对，与SourceAnalyzer.similar_size结果一致(以文件数较多的一方为基准)
+        :return: (左下标, 右下标) -> 大小差异比
+        """
+        if numpy is None:
+            result = {}
+            for index_l, index_r in size_band_pairs(self.sizes, size_ratio):
+                base = self.sizes[index_l] if self.counts[index_l] > self.counts[index_r] else self.sizes[index_r]
+                if base != 0:
+                    difference = abs(self.sizes[index_l] - self.sizes[index_r]) / base
+                    if difference < size_ratio:
+                        result[(index_l, index_r)] = difference
+            return result
+
+        # 按大小排序后分块，每块只与大小区间内的列比较(与size_band_pairs相同的必要条件)
+        order = numpy.argsort(numpy.array(self.sizes, dtype=numpy.int64), kind="stable")
+        sizes = numpy.array(self.sizes, dtype=numpy.int64)[order]
+        counts = numpy.array(self.counts, dtype=numpy.int64)[order]
+        n = len(sizes)
+        result = {}
+        for begin in range(0, n, BLOCK_SIZE):
+            end = min(n, begin + BLOCK_SIZE)
+            upper = int(numpy.searchsorted(sizes, sizes[end - 1] / (1 - size_ratio) * (1 + 1e-9), side="right"))
+            block_sizes = sizes[begin:end, None]
+            block_counts = counts[begin:end, None]
+            column_sizes = sizes[None, begin:upper]
+            column_counts = counts[None, begin:upper]
+            # 文件数相同时SourceAnalyzer以下标较大的一方为基准
+            row_is_left = (block_counts > column_counts) | \
+                ((block_counts == column_counts) & (order[begin:end, None] > order[None, begin:upper]))
+            base = numpy.where(row_is_left, block_sizes, column_sizes)
+            with numpy.errstate(divide="ignore", invalid="ignore"):
+                difference = numpy.abs(block_sizes - column_sizes) / base
+            mask = (base != 0) & (difference < size_ratio)
+            mask &= numpy.arange(end - begin)[:, None] < numpy.arange(upper - begin)[None, :]  # 只保留上三角
+            rows, cols = numpy.nonzero(mask)
+            lefts = order[rows + begin].tolist()
+            rights = order[cols + begin].tolist()
+            for left, right, value in zip(lefts, rights, difference[rows, cols].tolist()):
+                result[(left, right) if left < right else (right, left)] = value
+        return result
+
+    @timed("FeatureScreen.structure_pairs")
+    def structure_pairs(self, similar_ratio: float = 0.8, count_ratio: float = 0.6) -> Set[Tuple[int, int]]:
+        """可能结构相似的作业对，包含SourceAnalyzer.similar_structure判断为相似的全部作业对
+        两个路径的相似度2 * LCS / (la + lb)不超过字符多重集合交集给出的上界。先对所有不同的路径两两求出上界
+        大于similar_ratio的路径对，再统计每对作业中文件数较多的一方有多少文件可能在另一方找到相似路径，
+        该数目占比不超过count_ratio的作业对必然不相似。
+        """
+        distinct: Dict[str, int] = {}  # 路径 -> 编号
+        files = [[distinct.setdefault(path, len(distinct)) for path in paths] for paths in self.__paths]
+        paths = list(distinct)
+        n = len(files)
+        if numpy is None:
+            holders: List[Set[int]] = [set() for _ in paths]  # 各路径所属的作业
+            for index, it in enumerate(files):
+                for path in it:
+                    holders[path].add(index)
+            bags = [Counter(path) for path in paths]
+            reach: List[Set[int]] = [set(it) for it in holders]  # 含有可能相似路径的作业
+            for x in range(len(paths) - 1):
+                for y in range(x + 1, len(paths)):
+                    total = len(paths[x]) + len(paths[y])
+                    if 2.0 * min(len(paths[x]), len(paths[y])) / total > similar_ratio and \
+                            2.0 * sum((bags[x] & bags[y]).values()) / total > similar_ratio:
+                        reach[x] |= holders[y]
+                        reach[y] |= holders[x]
+            similar = []
+            for index, it in enumerate(files):
+                row = [0] * n
+                for path in it:
+                    for other in reach[path]:
+                        row[other] += 1
+                similar.append(row)
+        else:
+            # 路径字符直方图，按行分块求与全部路径的多重集合交集；
+            # 作业含有的路径(N×D)乘以路径可能相似的作业(D×N)，得到每个作业可能找到相似路径的文件数
+            alphabet = {char: index for index, char in enumerate(sorted({char for path in paths for char in path}))}
+            histograms = numpy.zeros((len(paths), len(alphabet)), dtype=numpy.int32)
+            for index, path in enumerate(paths):
+                for char in path:
+                    histograms[index, alphabet[char]] += 1
+            lengths = histograms.sum(axis=1)
+            incidence = numpy.zeros((n, len(paths)), dtype=numpy.float32)
+            for index, it in enumerate(files):
+                numpy.add.at(incidence[index], it, 1)
+            holders = (incidence > 0).astype(numpy.float32)
+            similar = numpy.zeros((n, n), dtype=numpy.float32)
+            block = max(1, BLOCK_ELEMENTS // max(1, len(paths) * len(alphabet)))
+            for begin in range(0, len(paths), block):
+                end = min(len(paths), begin + block)
+                common = numpy.minimum(histograms[begin:end, None, :], histograms[None, :, :]).sum(axis=2)
+                total = lengths[begin:end, None] + lengths[None, :]
+                partners = (2.0 * numpy.minimum(lengths[begin:end, None], lengths[None, :]) / total > similar_ratio) \
+                    & (2.0 * common / total > similar_ratio)
+                reach = (partners.astype(numpy.float32) @ holders.T) > 0
+                similar += incidence[:, begin:end] @ reach.astype(numpy.float32)
+            similar = similar.astype(numpy.int64).tolist()
+
+        result = set()
+        for index_l in range(n - 1):
+            for index_r in range(index_l + 1, n):
+                if self.sizes[index_l] == 0 or self.sizes[index_r] == 0:
+                    continue
+                # 与SourceAnalyzer相同，文件数相同时以右侧为基准
+                left, right = (index_l, index_r) if self.counts[index_l] > self.counts[index_r] else (index_r, index_l)
+                if similar[left][right] / self.counts[left] > count_ratio:
+                    result.add((index_l, index_r))
+        return result
+
+    @staticmethod
+    @timed("FeatureScreen.report_name_pairs")
+    def report_name_pairs(names: List[Tuple[str, str]], ratio: float) -> Set[Tuple[int, int]]:
+        """实验报告文件名可能相似的作业对，包含所有相似度大于ratio的作业对
+        difflib的相似度2M/T中匹配字符数M不超过两个文件名字符多重集合的交集大小(即quick_ratio上界)，
+        上界不大于ratio的作业对必然不相似。两个文件名均为空时相似度为1。
+        :param names: 各作业用于比较的报告文件名(作为左侧时, 作为右侧时)
+        """
+        n = len(names)
+        if numpy is None:
+            lefts = [Counter(left) for left, _ in names]
+            rights = [Counter(right) for _, right in names]
+            result = set()
+            for index_l in range(n - 1):
+                length = len(names[index_l][0])
+                for index_r in range(index_l + 1, n):
+                    total = length + len(names[index_r][1])
+                    if total == 0:
+                        result.add((index_l, index_r))
+                    elif 2.0 * min(length, total - length) / total > ratio and \
+                            2.0 * sum((lefts[index_l] & rights[index_r]).values()) / total > ratio:
+                        result.add((index_l, index_r))
+            return result
+
+        # 字符直方图矩阵，按行分块计算与其后各行的多重集合交集大小
+        alphabet = {char: index for index, char in enumerate(sorted({char for it in names for name in it
+                                                                     for char in name}))}
+        lefts = numpy.zeros((n, len(alphabet)), dtype=numpy.int32)
+        rights = numpy.zeros((n, len(alphabet)), dtype=numpy.int32)
+        for index, (left, right) in enumerate(names):
+            for char in left:
+                lefts[index, alphabet[char]] += 1
+            for char in right:
+                rights[index, alphabet[char]] += 1
+        left_lengths = lefts.sum(axis=1)
+        right_lengths = rights.sum(axis=1)
+        block = max(1, BLOCK_ELEMENTS // max(1, n * len(alphabet)))
+        result = set()
+        for begin in range(0, n - 1, block):
+            end = min(n - 1, begin + block)
+            common = numpy.minimum(lefts[begin:end, None, :], rights[None, begin + 1:, :]).sum(axis=2)
+            total = left_lengths[begin:end, None] + right_lengths[None, begin + 1:]
+            with numpy.errstate(divide="ignore", invalid="ignore"):
+                mask = (total == 0) | (2.0 * common / total > ratio)
+            mask &= numpy.arange(begin, end)[:, None] < numpy.arange(begin + 1, n)[None, :]  # 只保留上三角
+            rows, cols = numpy.nonzero(mask)
+            result.update(zip((rows + begin).tolist(), (cols + begin + 1).tolist()))
+        return result
+
+    def count_ratio(self, index_l: int, index_r: int) -> float:
+        """文件数比(较少一方除以较多一方)"""
+        more = max(self.counts[index_l], self.counts[index_r])
+        return min(self.counts[index_l], self.counts[index_r]) / more if more > 0 else 0.0
+
+    def extension_similarity(self, index_l: int, index_r: int) -> float:
+        """文件后缀分布的余弦相似度"""
+        if numpy is not None:
+            return float(self.__histograms[index_l] @ self.__histograms[index_r])
+        return sum(x * y for x, y in zip(self.histograms[index_l], self.histograms[index_r]))
@@ -1,32 +1,174 @@
-from typing import List, Tuple
+import array
+import bisect
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from profiler import span
+
+# 路径组成部分的全局驻留表：各作业的路径大量重复相同的目录名与文件名，
+# 路径以组成部分编号的元组保存，相同的路径共享同一元组对象。
+# 编号只在当前进程内有效，序列化时还原为字符串(见Source.__getstate__)
+_COMPONENT_IDS: Dict[str, int] = {}  # 组成部分 -> 编号
+_COMPONENTS: List[str] = []  # 编号 -> 组成部分
+_COMPONENT_LENGTHS = array.array("I")  # 编号 -> 组成部分长度
+_PATHS: Dict[Tuple[int, ...], Tuple[int, ...]] = {}  # 已驻留的路径元组
+
+PathIds = Tuple[int, ...]
+
+
+def intern_path(path: str) -> PathIds:
+    """将路径按/拆分，返回各组成部分编号的元组"""
+    ids = []
+    for component in path.split("/"):
+        component_id = _COMPONENT_IDS.get(component)
+        if component_id is None:
+            component_id = len(_COMPONENTS)
+            _COMPONENT_IDS[component] = component_id
+            _COMPONENTS.append(component)
+            _COMPONENT_LENGTHS.append(len(component))
+        ids.append(component_id)
+    ids = tuple(ids)
+    return _PATHS.setdefault(ids, ids)
+
+
+def path_string(ids: PathIds) -> str:
+    """还原编号元组对应的路径"""
+    return "/".join([_COMPONENTS[it] for it in ids])
+
+
+def path_length(ids: PathIds) -> int:
+    """编号元组对应路径的字符数"""
+    return sum(_COMPONENT_LENGTHS[it] for it in ids) + len(ids) - 1
+
+
+def common_affix(left: PathIds, right: PathIds) -> Tuple[int, int]:
+    """按组成部分编号比较两路径，返回公共前缀与公共后缀的字符数(含分隔符，二者不重叠)"""
+    limit = min(len(left), len(right)) - 1
+    prefix = 0
+    k = 0
+    while k < limit and left[k] == right[k]:
+        prefix += _COMPONENT_LENGTHS[left[k]] + 1
+        k += 1
+    suffix = 0
+    m = 1
+    while k + m <= limit and left[-m] == right[-m]:
+        suffix += _COMPONENT_LENGTHS[left[-m]] + 1
+        m += 1
+    return prefix, suffix
+
+
+class StructureIndex:
+    """文件列表的预处理结果，用于快速结构比较
+    每个Source只构建一次，包含路径编号元组到下标的哈希表、按长度排序的下标以及逐字符的位掩码
+    """
+
+    def __init__(self, paths: List[PathIds]):
+        self.paths = paths
+        self.first: Dict[PathIds, int] = {}  # 路径 -> 首次出现的下标
+        for index, ids in enumerate(paths):
+            self.first.setdefault(ids, index)
+        self.path_lengths: List[int] = [path_length(ids) for ids in paths]
+        self.by_length: List[Tuple[int, int]] = sorted((length, index) for index, length in
+                                                       enumerate(self.path_lengths))
+        self.lengths: List[int] = [length for length, _ in self.by_length]
+        self.__masks: List[Optional[Dict[str, int]]] = [None] * len(paths)
+
+    def masks(self, index: int) -> Dict[str, int]:
+        """字符 -> 出现位置位掩码"""
+        masks = self.__masks[index]
+        if masks is None:
+            masks = {}
+            for pos, ch in enumerate(path_string(self.paths[index])):
+                masks[ch] = masks.get(ch, 0) | (1 << pos)
+            self.__masks[index] = masks
+        return masks
+
+    def window(self, length: int, ratio: float) -> List[int]:
+        """返回长度满足相似度上界 2 * min(la, lb) / (la + lb) > ratio 的文件下标(按下标排序)"""
+        low = length * ratio / (2 - ratio)
+        high = length * (2 - ratio) / ratio if ratio > 0 else float("inf")
+        begin = bisect.bisect_right(self.lengths, low)
+        end = bisect.bisect_left(self.lengths, high)
+        return sorted(index for _, index in self.by_length[begin:end])
+
+
+def lcs_length(text: str, masks: Dict[str, int], length: int, offset: int = 0) -> int:
+    """位并行求最长公共子序列长度(Allison-Dix)
+    :param masks: 另一字符串的字符位掩码
+    :param length: 参与比较的另一字符串片段长度
+    :param offset: 片段在另一字符串中的起始位置
+    """
+    full = (1 << length) - 1
+    v = full
+    for ch in text:
+        u = v & (masks.get(ch, 0) >> offset)
+        v = ((v + u) | (v - u)) & full
+    return length - bin(v).count("1")
 
 
 class Source:
-    """源代码类"""
+    """源代码类
+    文件路径以驻留的组成部分编号元组保存，各文件大小与内容哈希保存在数组中。
+    """
+
+    __slots__ = ("size", "paths", "sizes", "hashes", "normalized_hashes", "fingerprints", "__index")
 
     def __init__(self):
         self.size = 0  # 源码大小
-        self.files: List[str] = []  # 文件列表
+        self.paths: List[PathIds] = []  # 文件路径(组成部分编号元组)
+        self.sizes = array.array("q")  # 各文件大小
+        self.hashes = array.array("Q")  # 各文件内容哈希，0表示未计算(如文件被跳过)
+        self.normalized_hashes = array.array("Q")  # 各源码文件去除注释与空白后的哈希，0表示不支持的语言
+        self.fingerprints: Set[int] = set()  # 源码内容指纹
+        self.__index: Optional[StructureIndex] = None  # 结构比较索引(惰性构建)
 
     def __len__(self) -> int:
-        return len(self.files)
+        return len(self.paths)
 
     def __getitem__(self, item: int) -> str:
-        return self.files[item]
+        return path_string(self.paths[item])
 
-    def __iter__(self):
-        return self.files.__iter__()
+    def __iter__(self) -> Iterator[str]:
+        return map(path_string, self.paths)
 
     def append(self, file: str, size: int):
-        self.files.append(file)
+        self.paths.append(intern_path(file))
+        self.sizes.append(size)
+        self.hashes.append(0)
+        self.normalized_hashes.append(0)
         self.size += size
+        self.__index = None
+
+    def add_fingerprints(self, fingerprints: Set[int]):
+        """合并单个文件的内容指纹"""
+        self.fingerprints |= fingerprints
+
+    def structure_index(self) -> StructureIndex:
+        """获取结构比较索引，文件列表不变时只构建一次"""
+        if self.__index is None:
+            self.__index = StructureIndex(self.paths)
+        return self.__index
+
+    def __getstate__(self) -> dict:
+        # 编号只在当前进程内有效，路径以字符串保存；结构比较索引可随时重建，不保存
+        return {"size": self.size, "files": list(self), "sizes": self.sizes, "hashes": self.hashes,
+                "normalized_hashes": self.normalized_hashes, "fingerprints": self.fingerprints}
+
+    def __setstate__(self, state: dict):
+        self.size = state["size"]
+        self.paths = [intern_path(file) for file in state["files"]]
+        self.sizes = state["sizes"]
+        self.hashes = state["hashes"]
+        self.normalized_hashes = state["normalized_hashes"]
+        self.fingerprints = state["fingerprints"]
+        self.__index = None
 
 
 class SourceAnalyzer:
     """源码分析类
     """
 
-    def __init__(self, left: Source, right: Source, size_ratio=0.10, count_ratio=0.6, similar_ratio=0.8):
+    def __init__(self, left: Source, right: Source, size_ratio=0.10, count_ratio=0.6, similar_ratio=0.8,
+                 fast: bool = True):
         # 左手侧为较大的数组
         if len(left) > len(right):
             self.__left = left
@@ -37,29 +179,91 @@ class SourceAnalyzer:
         self.__size_ratio = size_ratio  # 相似大小比阈值
         self.__count_ratio = count_ratio  # 相似数量比阈值
         self.__similar_ratio = similar_ratio  # 相似度阈值
-        self.__similar_analysis: List[(int, int, int)] = []  # 分析结果
+        self.__fast = fast  # 是否使用快速结构比较
+        self.__similar_analysis: List[Tuple[int, int, float]] = []  # 分析结果
+        self.structure_ratio: Optional[float] = None  # 结构相似的文件占比，similar_structure后可用
+
+    def size_difference(self) -> Optional[float]:
+        """大小差异比，左侧大小为0时返回None"""
+        if self.__left.size != 0:
+            return abs(self.__left.size - self.__right.size) / self.__left.size
+        return None
 
     def similar_size(self) -> bool:
         """大小相似"""
-        if self.__left.size != 0:
-            return (abs(self.__left.size - self.__right.size) / self.__left.size) < self.__size_ratio
-        else:
-            return False
+        with span("SourceAnalyzer.similar_size"):
+            difference = self.size_difference()
+            return difference is not None and difference < self.__size_ratio
 
     def similar_structure(self) -> bool:
         """检查文件结构是否相似(包含文件名)"""
+        with span("SourceAnalyzer.similar_structure"):
+            if self.__fast:
+                return self.__similar_structure_fast()
+            return self.__similar_structure_difflib()
+
+    def __similar_structure_fast(self) -> bool:
+        """快速结构比较
+        相同路径通过编号元组的哈希表直接匹配；其余路径先按长度上界筛选，再以位并行LCS计算相似度
+        2 * LCS / (la + lb)(即插入/删除编辑距离归一化后的相似度)，低于当前阈值的候选提前跳过。
+        公共前缀与后缀必然属于LCS，按组成部分编号识别后不再逐字符比较。
+        difflib的匹配字符数不超过LCS，该相似度不低于difflib的ratio，因此fast=False时相似的文件在此同样相似，
+        结构相似比例不低于difflib的结果(如/Lab01/src/bbdbcddbdc.java与/Lab01/sra/bbebcdbbdb.java在此相似，difflib为0.73)。
+        """
+        if self.__left.size == 0 or self.__right.size == 0:
+            return False
+
+        r_index = self.__right.structure_index()
+        similar_count = 0
+        result = []
+        for i, ids in enumerate(self.__left.paths):
+            j = r_index.first.get(ids)
+            if j is not None:
+                result.append((i, j, 1.0))
+                similar_count += 1
+                continue
+            max_ratio = self.__similar_ratio
+            max_r_index = -1
+            path = None
+            length = path_length(ids)
+            for j in r_index.window(length, max_ratio):
+                r_length = r_index.path_lengths[j]
+                total = length + r_length
+                if 2 * min(length, r_length) / total <= max_ratio:  # 阈值已提高，长度上界不再满足
+                    continue
+                if path is None:
+                    path = path_string(ids)
+                # 按编号比较去除公共的前后缀组成部分，只对中间部分计算LCS
+                prefix, suffix = common_affix(ids, r_index.paths[j])
+                common = prefix + suffix + lcs_length(path[prefix:length - suffix], r_index.masks(j),
+                                                      r_length - prefix - suffix, prefix)
+                ratio = 2 * common / total
+                if ratio > max_ratio:
+                    max_ratio = ratio
+                    max_r_index = j
+            if max_r_index != -1:
+                result.append((i, max_r_index, max_ratio))
+                similar_count += 1
+        self.__similar_analysis = result  # 保存比较结果
+        self.structure_ratio = similar_count / len(self.__left)
+
+        return self.structure_ratio > self.__count_ratio
+
+    def __similar_structure_difflib(self) -> bool:
+        """基于difflib的逐对结构比较"""
 
         import difflib
         if self.__left.size == 0 or self.__right.size == 0:
             return False
 
+        left, right = list(self.__left), list(self.__right)
         similar_count = 0
         result = []
-        for i in range(len(self.__left)):
+        for i in range(len(left)):
             max_ratio = 0
             max_r_index: int = 0
-            for j in range(len(self.__right)):
-                s = difflib.SequenceMatcher(None, self.__left[i], self.__right[j])
+            for j in range(len(right)):
+                s = difflib.SequenceMatcher(None, left[i], right[j])
                 ratio = s.ratio()
                 if ratio > max_ratio:
                     max_ratio = ratio
@@ -68,9 +272,102 @@ class SourceAnalyzer:
                 result.append((i, max_r_index, max_ratio))
                 similar_count += 1
         self.__similar_analysis = result  # 保存比较结果
+        self.structure_ratio = similar_count / len(self.__left)
 
-        return similar_count / len(self.__left) > self.__count_ratio
+        return self.structure_ratio > self.__count_ratio
 
-    def get_analysis(self) -> List[Tuple[str, str, int]]:
+    def get_analysis(self) -> List[Tuple[str, str, float]]:
         """返回相似度分析详情信息"""
         return [(self.__left[x], self.__right[y], z) for x, y, z in self.__similar_analysis]
+
+
+class CodeAnalyzer:
+    """源码内容相似度分析
+    以指纹倒排索引统计所有作业两两之间的公共指纹数，只有共享指纹的作业对才会被计数，
+    出现在过多作业中的指纹(如实验给出的模板代码、标识符归一化后的常见写法)被忽略。
+    出现在超过common_count个作业(作业较少时为一半作业，作业较多时为作业数*common_ratio)中的指纹视为公共指纹，
+    每个指纹计数的作业对数有上限，统计量与指纹总数成线性关系。
+    也用于实验报告内容的比较(Report同样具有fingerprints属性)。
+    """
+
+    def __init__(self, sources: List[Source], overlap_ratio=0.5, common_ratio=0.05, common_count=20):
+        self.__sources = sources
+        self.__overlap_ratio = overlap_ratio  # 相似重合比例阈值
+        self.__common_ratio = common_ratio  # 公共指纹比例阈值
+        self.__common_count = common_count  # 公共指纹作业数阈值
+        self.__index: Dict[int, List[int]] = {}  # 指纹 -> 作业下标
+        self.__overlaps: Optional[Dict[Tuple[int, int], Tuple[float, float]]] = None  # 全部作业对的重合比例
+        for index, source in enumerate(sources):
+            for fingerprint in source.fingerprints:
+                self.__index.setdefault(fingerprint, []).append(index)
+
+    def similar_code(self) -> Dict[Tuple[int, int], Tuple[float, float]]:
+        """返回源码内容相似的作业对
+        重合比例只统计非公共指纹。
+        :return: (左下标, 右下标) -> (公共指纹占左侧指纹比例, 公共指纹占右侧指纹比例)
+        """
+        return {pair: ratios for pair, ratios in self.overlaps().items() if max(ratios) >= self.__overlap_ratio}
+
+    def overlaps(self) -> Dict[Tuple[int, int], Tuple[float, float]]:
+        """返回所有共享非公共指纹的作业对及其重合比例(不按阈值过滤)，未出现的作业对重合比例为0"""
+        if self.__overlaps is None:
+            with span("CodeAnalyzer.similar_code"):
+                self.__overlaps = self.__count_overlaps()
+        return self.__overlaps
+
+    def __count_overlaps(self) -> Dict[Tuple[int, int], Tuple[float, float]]:
+        count = len(self.__sources)
+        limit = max(2, min(self.__common_count, count // 2), int(count * self.__common_ratio))
+        shared: Dict[Tuple[int, int], int] = {}
+        counts = [0] * len(self.__sources)  # 各作业的非公共指纹数
+        for indices in self.__index.values():
+            if len(indices) > limit:
+                continue
+            for index in indices:
+                counts[index] += 1
+            for x in range(len(indices) - 1):
+                for y in range(x + 1, len(indices)):
+                    pair = (indices[x], indices[y])
+                    shared[pair] = shared.get(pair, 0) + 1
+        return {(index_l, index_r): (count / counts[index_l], count / counts[index_r])
+                for (index_l, index_r), count in shared.items()}
+
+
+class DuplicateAnalyzer:
+    """相同文件检测
+    以文件内容哈希(源码文件使用去除注释与空白后的哈希，文件改名或重新格式化后仍相同)建立哈希到作业的索引，
+    一次遍历即可找出共享相同文件的作业对。出现在过多作业中的文件(如实验给出的模板代码)与过小的文件被忽略。
+    """
+
+    def __init__(self, sources: List[Source], common_ratio=0.5, min_size=100):
+        self.__count = len(sources)
+        self.__common_ratio = common_ratio  # 公共文件比例阈值
+        self.__index: Dict[int, List[int]] = {}  # 文件哈希 -> 作业下标
+        for index, source in enumerate(sources):
+            keys = set()
+            for size, content, normalized in zip(source.sizes, source.hashes, source.normalized_hashes):
+                key = normalized or content
+                if key != 0 and size >= min_size:
+                    keys.add(key)
+            for key in keys:
+                self.__index.setdefault(key, []).append(index)
+
+    def duplicate_files(self, min_shared: int = 1) -> Dict[Tuple[int, int], Tuple[float, float]]:
+        """返回共享至少min_shared个相同文件的作业对
+        :return: (左下标, 右下标) -> (相同文件占左侧文件比例, 相同文件占右侧文件比例)，只统计非公共文件
+        """
+        with span("DuplicateAnalyzer.duplicate_files"):
+            limit = max(2, int(self.__count * self.__common_ratio))
+            shared: Dict[Tuple[int, int], int] = {}
+            counts = [0] * self.__count  # 各作业的非公共文件数
+            for indices in self.__index.values():
+                if len(indices) > limit:
+                    continue
+                for index in indices:
+                    counts[index] += 1
+                for x in range(len(indices) - 1):
+                    for y in range(x + 1, len(indices)):
+                        pair = (indices[x], indices[y])
+                        shared[pair] = shared.get(pair, 0) + 1
+            return {(index_l, index_r): (count / counts[index_l], count / counts[index_r])
+                    for (index_l, index_r), count in shared.items() if count >= min_shared}
@@ -1,10 +1,20 @@
 import csv
+import os
+import re
+import sqlite3
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+ID_PATTERN = r"^.{13}"  # 默认学号提取规则：作业文件名的前13个字符
+INDEX_VERSION = 1  # 学生名单索引格式变化时递增
+LOOKUP_BATCH = 500  # 批量查询时每条SQL语句的学号数
 
 
 class Student:
     """学生类
     """
 
+    __slots__ = ("num", "name")
+
     def __init__(self, num: str = "", name: str = ""):
         self.num = num
         self.name = name
@@ -18,18 +28,86 @@ class Student:
 
 class StudentInfo:
     """学生信息
+    默认在第一次查询时将CSV文件读入内存。指定index_path时使用SQLite索引文件(不存在或CSV变化时重建，
+    可供多门课程共用)，查询时只读取需要的学号，适用于很大的学生名单。
     """
 
-    def __init__(self, input_path: str):
+    def __init__(self, input_path: str, index_path: Optional[str] = None):
+        self.__input_path = input_path
+        self.__index_path = index_path
+        self.__data: Optional[dict] = None  # 学号 -> 姓名简称(惰性读取)
+        self.__connection: Optional[sqlite3.Connection] = None
+
+    def __rows(self) -> Iterator[Tuple[str, str]]:
         # 从CSV文件中读取学生信息
-        self.__data: dict = {}
-        with open(input_path, mode='r') as csv_file:
+        with open(self.__input_path, mode='r') as csv_file:
             reader = csv.reader(csv_file)
             reader.__next__()  # 去除表头
             for row in reader:
-                self.__data[row[0]] = row[2]
+                yield row[0], row[2]
+
+    def __index(self) -> sqlite3.Connection:
+        """打开SQLite索引，索引记录的CSV文件大小或修改时间不一致时重建"""
+        if self.__connection is None:
+            stat = os.stat(self.__input_path)
+            meta = (INDEX_VERSION, stat.st_size, stat.st_mtime_ns)
+            connection = None
+            if os.path.exists(self.__index_path):
+                connection = sqlite3.connect(self.__index_path)
+                try:
+                    if connection.execute("SELECT version, size, mtime FROM meta").fetchone() != meta:
+                        connection.close()
+                        connection = None
+                except sqlite3.DatabaseError:
+                    connection.close()
+                    connection = None
+            if connection is None:
+                print("[Info]Building student list index..")
+                temp = f"{self.__index_path}.tmp"
+                if os.path.exists(temp):
+                    os.remove(temp)
+                connection = sqlite3.connect(temp)
+                connection.execute("CREATE TABLE meta (version INTEGER, size INTEGER, mtime INTEGER)")
+                connection.execute("CREATE TABLE students (num TEXT PRIMARY KEY, name TEXT) WITHOUT ROWID")
+                connection.execute("INSERT INTO meta VALUES (?, ?, ?)", meta)
+                connection.executemany("INSERT OR REPLACE INTO students VALUES (?, ?)", self.__rows())
+                connection.commit()
+                connection.close()
+                os.replace(temp, self.__index_path)  # 原子替换，避免中断时留下不完整的索引
+                connection = sqlite3.connect(self.__index_path)
+            connection.execute("PRAGMA mmap_size = 268435456")  # 以内存映射方式读取索引
+            self.__connection = connection
+        return self.__connection
+
+    def lookup(self, nums: Iterable[str]) -> Dict[str, str]:
+        """批量查询学号对应的姓名简称
+        :return: 学号 -> 姓名简称，只包含找到的学号
+        """
+        if self.__index_path is None:
+            if self.__data is None:
+                self.__data = dict(self.__rows())
+            return {num: self.__data[num] for num in nums if num in self.__data}
+        connection = self.__index()
+        nums = list(nums)
+        result = {}
+        for begin in range(0, len(nums), LOOKUP_BATCH):
+            batch = nums[begin:begin + LOOKUP_BATCH]
+            marks = ", ".join("?" * len(batch))
+            result.update(connection.execute(f"SELECT num, name FROM students WHERE num IN ({marks})", batch))
+        return result
 
     def __getitem__(self, item: str) -> str:
         """通过学号查询姓名简称，找不到则抛出异常
         """
-        return self.__data[item]
+        result = self.lookup([item])
+        if item not in result:
+            raise KeyError(item)
+        return result[item]
+
+
+def student_id(filename: str, pattern: re.Pattern) -> Optional[str]:
+    """从作业包中的文件名提取学号，模式中有分组时取第一个分组，不匹配时返回None"""
+    match = pattern.search(filename)
+    if match is None:
+        return None
+    return match.group(1 if pattern.groups > 0 else 0)
@@ -1,10 +1,34 @@
+import copy
+import csv
+import difflib
+import io
 import os
+import pickle
+import random
+import re
 import shutil
+import time
 import zipfile
 from pathlib import Path
 
+import pytest
+
 import assignment
+import cache
+import candidate
+import cluster
+import corpus
+import document
+import fileUtil
+import fingerprint
+import journal
+import profiler
+import score
+import screen
+import source as source_module
 import student
+from report import Report
+from source import Source, SourceAnalyzer, CodeAnalyzer
 from student import StudentInfo
 
 
@@ -58,6 +82,589 @@ class TestNormLab:
         expect_path = path / "Output-Expected"
         assert check_output_expected(expect_path, output_path)
 
+    def test_checker_ignore_rules(self):
+        checker = assignment.AssignmentChecker(ignore_patterns=["node_modules/", "*.log", "!keep.log"])
+        assert checker.check_both("Lab01/src/targeting/Main.java")
+        assert not checker.check_both("Lab01/target/classes/Main.java")
+        assert not checker.check_both("web/node_modules/a/index.js")
+        assert not checker.check_both("Lab01/build.log")
+        assert checker.check_both("Lab01/keep.log")
+
+    def test_skip_filtered_nested_archive(self, tmp_path):
+        nested = tmp_path / "nested.zip"
+        with zipfile.ZipFile(nested, "w") as archive:
+            archive.writestr(".git/objects/ab", "x" * 100)
+            archive.writestr("target/Main.class", "x" * 50)
+        with zipfile.ZipFile(tmp_path / "Lab01-test.zip", "w") as archive:
+            archive.writestr("Lab01/src/Main.java", "class Main {}")
+            archive.write(nested, "Lab01/history.zip")
+        ass = assignment.Assignment("01", student.Student("", "test"), tmp_path / "Output",
+                                    assignment.AssignmentChecker())
+        with zipfile.ZipFile(tmp_path / "Lab01-test.zip") as package:
+            ass.process_assignment(package)
+        assert (ass.filtered_count, ass.filtered_bytes) == (2, 150)
+        assert list(ass.source) == ["/Lab01/src/Main.java"]
+
+    def test_nested_archive_limits(self, tmp_path, monkeypatch):
+        def make_zip(files: dict) -> bytes:
+            data = io.BytesIO()
+            with zipfile.ZipFile(data, "w") as archive:
+                for name, content in files.items():
+                    archive.writestr(name, content)
+            return data.getvalue()
+
+        deep = make_zip({"b/B.java": "class B {}", "b/c.zip": make_zip({"Deep.java": "class Deep {}"})})
+        nested = make_zip({"A.java": "class A {}", "deep.zip": deep})
+        big = make_zip({"Big.java": "x" * 5000})
+        with zipfile.ZipFile(tmp_path / "Lab01-test.zip", "w") as archive:
+            archive.writestr("Lab01/src/Main.java", "class Main {}")
+            archive.writestr("Lab01/a.zip", nested)
+            archive.writestr("Lab01/bad.zip", b"not a zip archive")
+            archive.writestr("Lab01/big.zip", big)
+        opened = []
+
+        def open_recorded(archive, file, spill_size, chunk_size):
+            buffer = fileUtil.open_nested_archive(archive, file, spill_size, chunk_size)
+            opened.append((file.filename, isinstance(buffer, io.BytesIO)))
+            return buffer
+
+        monkeypatch.setattr(assignment, "open_nested_archive", open_recorded)
+        # 单个压缩包都能读入内存，但a.zip与deep.zip仍打开时big.zip超出剩余额度，写入临时文件
+        checker = assignment.AssignmentChecker(spill_size=len(nested) + len(big) - 1, max_depth=2)
+        ass = assignment.Assignment("01", student.Student("", "test"), tmp_path / "Output", checker)
+        with zipfile.ZipFile(tmp_path / "Lab01-test.zip") as package:
+            ass.process_assignment(package)
+        assert opened == [("Lab01/a.zip", True), ("deep.zip", True), ("Lab01/bad.zip", True), ("Lab01/big.zip", False)]
+        assert [(Path(path).name, reason) for path, _, reason in ass.skipped] == \
+               [("c.zip", "nested archive depth limit"), ("bad.zip", "broken archive")]
+        assert sorted(Path(path).name for path in ass.source) == ["A.java", "B.java", "Big.java", "Main.java"]
+        assert (tmp_path / "Output" / "Lab01-test-manifest.csv").read_text().count("\n") == 3
+
+    def test_extract_size_limits(self, tmp_path):
+        main = java_statements(1)
+        with zipfile.ZipFile(tmp_path / "Lab01-test.zip", "w") as archive:
+            archive.writestr("Lab01/report.docx", b"d" * 200)
+            archive.writestr("Lab01/src/Main.java", main)
+            archive.writestr("Lab01/src/Big.java", "x" * 5000)
+            archive.writestr("Lab01/src/Lie.java", "y" * 300)
+            archive.writestr("Lab01/src/Extra.java", "z" * 500)
+
+        class DeclaredZipFile(zipfile.ZipFile):
+            """目录中Lie.java声明的大小小于实际大小"""
+
+            def open(self, name, *args, **kwargs):
+                if isinstance(name, zipfile.ZipInfo) and name.filename == "Lab01/src/Lie.java":
+                    name = copy.copy(name)
+                    name.file_size = 300
+                return super().open(name, *args, **kwargs)
+
+        # 报告同时保留在源代码目录时只计入一次总大小，Extra.java超出总大小限制
+        checker = assignment.AssignmentChecker(max_file_size=1000, max_total_size=200 + len(main) + 10 + 100)
+        ass = assignment.Assignment("01", student.Student("", "test"), tmp_path / "Output", checker, True)
+        with DeclaredZipFile(tmp_path / "Lab01-test.zip") as package:
+            package.getinfo("Lab01/src/Lie.java").file_size = 10
+            ass.process_assignment(package)
+        with open(tmp_path / "Output" / "Lab01-test-manifest.csv", newline="") as f:
+            assert list(csv.reader(f)) == [["File", "Size", "Reason"],
+                                           ["/Lab01/src/Big.java", "5000", "file size limit"],
+                                           ["/Lab01/src/Extra.java", "500", "assignment size limit"],
+                                           ["/Lab01/src/Lie.java", "300", "file size exceeds declared size"]]
+        assert ass.planned_size == 200 + len(main) + 10
+        assert sorted(path.name for path in (tmp_path / "Output").rglob("*.java")) == ["Main.java"]
+
+    def test_analyze_without_extract(self, tmp_path):
+        with zipfile.ZipFile(tmp_path / "Lab01-test.zip", "w") as archive:
+            archive.writestr("Lab01/src/Main.java", "class Main { int add(int a, int b) { return a + b; } }")
+            archive.writestr("Lab01/pom.xml", "<project/>")
+        results = []
+        for extract in [True, False]:
+            ass = assignment.Assignment("01", student.Student("", "test"), tmp_path / f"Output{extract}",
+                                        assignment.AssignmentChecker(extract=extract))
+            with zipfile.ZipFile(tmp_path / "Lab01-test.zip") as package:
+                ass.process_assignment(package)
+            results.append((list(ass.source), ass.source.size, ass.source.fingerprints))
+        assert results[0] == results[1] and len(results[1][2]) > 0
+        assert not (tmp_path / "OutputFalse").exists()
+
+    def test_size_band_pairs(self):
+        sizes = [0, 100, 105, 109, 111, 200, 95, 1000, 1099, 1100]
+        expect = set()
+        for i in range(len(sizes) - 1):
+            for j in range(i + 1, len(sizes)):
+                for a, b in [(sizes[i], sizes[j]), (sizes[j], sizes[i])]:
+                    if a != 0 and abs(a - b) / a < 0.10:
+                        expect.add((i, j))
+        assert expect <= candidate.size_band_pairs(sizes, 0.10)
+
+    def test_feature_screen_matches_similar_size(self):
+        sources = []
+        for size, count in [(100, 1), (105, 2), (95, 2), (0, 1), (120, 3), (111, 1), (100, 1)]:
+            src = Source()
+            for i in range(count):
+                src.append(f"/{i}.java", size // count if i else size - size // count * (count - 1))
+            sources.append(src)
+        expect = {(i, j) for i in range(len(sources)) for j in range(i + 1, len(sources))
+                  if SourceAnalyzer(sources[i], sources[j]).similar_size()}
+        assert set(screen.FeatureScreen(sources).size_pairs(0.10)) == expect
+
+    def test_feature_screen_without_numpy(self, monkeypatch):
+        sources = []
+        for size, files in [(100, ["/a.java"]), (105, ["/a.java", "/b.xml"]), (95, ["/c.py", "/d.py"]), (0, ["/e"]),
+                            (120, ["/f.java", "/g.java", "/h.txt"]), (111, ["/i.JAVA"]), (100, [])]:
+            src = Source()
+            for i, file in enumerate(files):
+                src.append(file, size // len(files) if i else size - size // len(files) * (len(files) - 1))
+            sources.append(src)
+        fast = screen.FeatureScreen(sources)
+        monkeypatch.setattr(screen, "numpy", None)
+        slow = screen.FeatureScreen(sources)
+        assert slow.size_pairs(0.10) == pytest.approx(fast.size_pairs(0.10))
+        pairs = [(i, j) for i in range(len(sources)) for j in range(i + 1, len(sources))]
+        assert [slow.count_ratio(i, j) for i, j in pairs] == [fast.count_ratio(i, j) for i, j in pairs]
+        assert [slow.extension_similarity(i, j) for i, j in pairs] == \
+            pytest.approx([fast.extension_similarity(i, j) for i, j in pairs])
+
+    def test_code_analyzer_renamed_copy(self):
+        body = "\n".join(f"if (a{i} > {i}) {{ b{i} = a{i} * {i}; list.add(b{i}); }} else {{ return c{i}; }}"
+                         for i in range(30))
+        texts = [body, body.replace("a", "q").replace("b", "w"), "class X { void m() { while (true) { } } }"]
+        sources = []
+        for text in texts:
+            src = Source()
+            src.append("/Main.java", len(text))
+            src.add_fingerprints(fingerprint.fingerprint_text(text, "Main.java"))
+            sources.append(src)
+        assert list(CodeAnalyzer(sources).similar_code().keys()) == [(0, 1)]
+
+    def test_code_analyzer_common_fingerprints(self):
+        # 标识符归一化后的常见写法出现在约30%的作业中，不应使统计量随作业数平方增长
+        rand = random.Random(5)
+        sources = []
+        for index in range(400):
+            src = Source()
+            unique = 10 ** 6 * (index + 1)
+            src.add_fingerprints(set(rand.sample(range(1000), 300)) | set(range(unique, unique + 50)))
+            sources.append(src)
+        copied = set(range(5 * 10 ** 8, 5 * 10 ** 8 + 100))
+        sources[0].add_fingerprints(copied)
+        sources[1].add_fingerprints(copied)
+        overlaps = CodeAnalyzer(sources).overlaps()
+        assert list(overlaps.keys()) == [(0, 1)] and overlaps[(0, 1)] == (100 / 150, 100 / 150)
+
+    def test_corpus_query(self, tmp_path):
+        body = "\n".join(f"while (x{i} < {i}) {{ y{i} = x{i} % {i}; print(y{i}); }}" for i in range(30))
+        sources = []
+        for text in [body, body.replace("x", "k"), "class X { int f() { return 1; } }"]:
+            src = Source()
+            src.append("/Main.java", len(text))
+            src.add_fingerprints(fingerprint.fingerprint_text(text, "Main.java"))
+            sources.append(src)
+        index = corpus.Corpus(tmp_path / "corpus")
+        index.update("2022/Lab01", [("A", sources[0]), ("C", sources[2])])
+        index.save()
+        index = corpus.Corpus(tmp_path / "corpus")
+        assert [index[it].student for it, _, _ in index.query(sources[1])] == ["A"]
+        assert index.query(sources[1], exclude_label="2022/Lab01") == []
+
+    def test_report_content_fingerprints(self, tmp_path):
+        essay = "".join(f"第{i}步：为边界条件编写测试用例并检查断言结果{i * 7}。" for i in range(20))
+        paths = []
+        for name, text in [("a", essay), ("b", essay + "我的总结"), ("c", essay[::-1])]:
+            path = tmp_path / f"{name}.docx"
+            with zipfile.ZipFile(path, "w") as docx:
+                docx.writestr("word/document.xml",
+                              '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+                              f"<w:body><w:p><w:r><w:t>{text}</w:t></w:r></w:p></w:body></w:document>")
+            paths.append(path)
+        fingerprints = [document.report_fingerprints(path) for path in paths]
+        assert len(fingerprints[0]) > 0
+        assert fingerprints[0] <= fingerprints[1]
+        assert len(fingerprints[0] & fingerprints[2]) < len(fingerprints[0]) / 2
+
+    def test_duplicate_files(self):
+        # 改名并重新格式化的相同文件被检出，多数作业共有的模板文件被忽略
+        code = "public class Stack { // storage\n private int[] items = new int[16]; private int size = 0;\n" \
+               "public int size() { return size; } public boolean isEmpty() { return size == 0; } }"
+        common = "public class Main { public static void main(String[] args) { System.out.println(1); } }" * 2
+        files = [[("A/Stack.java", code), ("A/Main.java", common.replace("1", "2"))],
+                 [("B/MyStack.java", code.replace(" // storage\n", "\n\n")), ("B/Main.java", common)],
+                 [("C/Queue.java", code.replace("Stack", "Queue")), ("C/Main.java", common)],
+                 [("D/Main.java", common)]]
+        sources = []
+        for student_files in files:
+            source = Source()
+            for index, (path, text) in enumerate(student_files):
+                source.append(path, len(text))
+                source.normalized_hashes[index] = fingerprint.normalized_hash(text, path)
+            sources.append(source)
+        assert source_module.DuplicateAnalyzer(sources).duplicate_files() == {(0, 1): (0.5, 1.0)}
+
+    def test_fingerprint_source_tokenizes_once(self, monkeypatch):
+        texts = [java_statements(seed) + "/* block */ String s = \"a // b\"; char c = '\\''; // tail\n"
+                 for seed in range(5)]
+        expect = [(fingerprint.fingerprint_text(text, "A.java"), fingerprint.normalized_hash(text, "A.java"))
+                  for text in texts]
+        calls = []
+
+        def counted(text, normalize=True):
+            calls.append(normalize)
+            return fingerprint.tokenize_java(text, normalize)
+
+        monkeypatch.setitem(fingerprint.TOKENIZERS, ".java", counted)
+        assert [fingerprint.fingerprint_source(text, "A.java") for text in texts] == expect
+        assert calls == [False] * len(texts)
+        assert fingerprint.fingerprint_source("x", "notes.txt") is None
+
+    def test_rescore_saved_scores(self, tmp_path):
+        names = ["A", "B", "C"]
+        rows = [(0, 1, (0.05, 0.9, None, 0.7, 0.6, None, None, None, None, 1.0, 1.0)),
+                (0, 2, (0.3, 0.65, 0.85, None, None, None, None, 0.5, 0.25, 0.5, 0.9)),
+                (1, 2, (0.5, None, None, None, None, None, None, None, None, 0.5, 0.8))]
+        score.save_scores(tmp_path / "scores.db", names, rows)
+        assert score.load_scores(tmp_path / "scores.db") == (names, rows)
+        assert [flag for _, _, flag, _ in score.rescore(rows, score.Thresholds())] == [0b1011, 0b100110, 0]
+        strict = score.Thresholds(size_ratio=0.01, count_ratio=0.7, report_ratio=0.9, overlap_ratio=0.8)
+        assert [flag for _, _, flag, _ in score.rescore(rows, strict)] == [0b10, 0b100000, 0]
+        assert [[partner for _, partner in it] for it in score.top_partners(3, rows, 1)] == [[2], [0], [0]]
+        assert [partner for _, partner in score.top_partners(3, rows, 2)[0]] == [2, 1]
+        limits = score.load_limits(tmp_path / "scores.db")
+        assert strict.within(limits) and score.Thresholds().within(limits)
+        assert not score.Thresholds(overlap_ratio=0.2).within(limits)
+        assert not score.Thresholds(size_ratio=0.2).within(limits)
+
+    def test_cache_second_run(self, tmp_path, monkeypatch, capsys):
+        members = {f"100{i}-{name}": ({"Lab01/src/Main.java": java_statements(i),
+                                       "Lab01/src/Util.java": java_statements(10 + i)}, "实验报告.doc")
+                   for i, name in enumerate("abcd")}
+        checked = []
+
+        def check_recorded(sources, report_keys, index_l, index_r):
+            checked.append((index_l, index_r))
+            return check_pair(sources, report_keys, index_l, index_r)
+
+        check_pair = assignment.check_pair
+        monkeypatch.setattr(assignment, "check_pair", check_recorded)
+
+        def run(checker: assignment.AssignmentChecker, use_cache: bool = True) -> str:
+            checked.clear()
+            capsys.readouterr()
+            result_cache = cache.ResultCache(tmp_path / "Lab01.cache", checker.signature()) if use_cache else None
+            manager = assignment.AssignmentManager("Lab01", result_cache)
+            with zipfile.ZipFile(tmp_path / "Lab01.zip") as package:
+                manager.process_package(package, StudentInfo(str(tmp_path / "students.csv")), tmp_path / "Output",
+                                        check=checker, id_pattern=r"^\d+")
+            manager.check(tmp_path / "Output", scores_path=tmp_path / "scores.db")
+            return capsys.readouterr().out
+
+        write_package(tmp_path, members)
+        run(assignment.AssignmentChecker())
+        assert sorted(checked) == [(l, r) for l in range(4) for r in range(l + 1, 4)]
+        # 修改一份作业后再次运行：其余作业跳过解压，它们之间的作业对复用上次的结果
+        members["1002-c"][0]["Lab01/src/Main.java"] = java_statements(20)
+        write_package(tmp_path, members)
+        printed = run(assignment.AssignmentChecker())
+        assert printed.count("[Info]Assignment unchanged:") == 3 and "Processing Assignment: 1002-c" in printed
+        assert sorted(checked) == [(0, 2), (1, 2), (2, 3)]
+        cached_scores = score.load_scores(tmp_path / "scores.db")
+        run(assignment.AssignmentChecker(), use_cache=False)
+        assert score.load_scores(tmp_path / "scores.db") == cached_scores
+        # 处理规则变化时缓存失效
+        printed = run(assignment.AssignmentChecker(max_file_size=1 << 20))
+        assert "[Info]Cache is outdated, rebuilding" in printed and "Assignment unchanged" not in printed
+        assert len(checked) == 6
+
+    def test_journal_resume(self, tmp_path):
+        path = tmp_path / "lab.journal"
+        log = journal.Journal(path, ("rules",))
+        for key in ["a", "b"]:
+            source = Source()
+            source.append(f"/{key}/Main.java", 10)
+            log.record(key, source, Report(f"{key}.docx", 100), (1, 5))
+        log.close()
+        with open(path, "r+b") as f:  # 最后一条记录写入中断
+            f.truncate(path.stat().st_size - 10)
+        log = journal.Journal(path, ("rules",))
+        assert len(log) == 1 and list(log.get("a")[0]) == ["/a/Main.java"] and log.get("a")[2] == (1, 5)
+        log.record("b", Source(), Report(), (0, 0))
+        log.close()
+        for signature, count in [(("rules",), 2), (("other rules",), 0)]:  # 处理规则变化时日志失效
+            log = journal.Journal(path, signature)
+            assert len(log) == count
+            log.close()
+
+    def test_student_index(self, tmp_path):
+        csv_path = tmp_path / "students.csv"
+        csv_path.write_text("num,full,short\n1001,A,a\n1002,B,b\n")
+        index = StudentInfo(str(csv_path), str(tmp_path / "students.sqlite"))
+        assert index.lookup(["1002", "1003", "1001"]) == StudentInfo(str(csv_path)).lookup(["1001", "1002"])
+        assert index["1001"] == "a"
+        with pytest.raises(KeyError):
+            index["1003"]
+        csv_path.write_text("num,full,short\n1001,A,a\n1002,B,b\n1003,C,c\n")  # 名单变化时重建索引
+        assert StudentInfo(str(csv_path), str(tmp_path / "students.sqlite"))["1003"] == "c"
+        pattern = re.compile(r"_(\d+)_")
+        assert student.student_id("lab1_1002_b.zip", pattern) == "1002"
+        assert student.student_id("1002.zip", pattern) is None
+        assert student.student_id("S202000000001-stu.zip", re.compile(student.ID_PATTERN)) == "S202000000001"
+
+    def test_candidate_check_matches_exhaustive(self, tmp_path):
+        # 只有末尾目录与文件名不同的深层路径：结构逐文件相似，末尾几级路径的分片却几乎不同
+        prefix = "Lab01/src/main/java/cn/edu/university/software/engineering/lab"
+        layouts = {
+            "1001-a": ([f"{prefix}/ctl/Ab{k}.java" for k in range(6)], 1000, "需求分析实验报告.doc"),
+            "1002-b": ([f"{prefix}/svc/Xy{k}.java" for k in range(6)], 1010, "测试用例设计.doc"),
+            "1003-c": (["web/index.html", "web/app.js"], 3000, "lab-report-final.doc"),
+            "1004-d": ([f"{prefix}/ctl/Ab{k}.java" for k in range(6)], 9000, "总结.doc"),
+        }
+        members = {member: ({path: f"// {member} {index}\n".ljust(size // len(paths), "x")
+                             for index, path in enumerate(paths)}, report)
+                   for member, (paths, size, report) in layouts.items()}
+        reports = []
+        for exhaustive in [False, True]:
+            output_path = tmp_path / f"Output{exhaustive}"
+            check_package(tmp_path, members, output_path, exhaustive=exhaustive)
+            reports.append([(output_path / name).read_text() for name in
+                            ["Similar Works Report.csv", "Similar Pairs Report.csv"]])
+        assert reports[0] == reports[1]
+        assert '1001-a,1002-b,"similar size, similar structure"' in reports[0][1]
+
+    def test_candidate_structure_subset(self, tmp_path):
+        # 文件数相差很大、路径只差一个字符：A的每个文件都能在B中找到相似路径
+        members = {
+            "1001-a": ({f"p/q/File{k}.java": "x" * 100 for k in range(20)}, "需求分析实验报告.doc"),
+            "1002-b": ({f"p/q/File{k}.java": "y" * 5000 for k in range(1, 3)}, "测试用例设计.doc"),
+        }
+        reports = []
+        for exhaustive in [False, True]:
+            output_path = tmp_path / f"Output{exhaustive}"
+            check_package(tmp_path, members, output_path, exhaustive=exhaustive)
+            reports.append((output_path / "Similar Works Report.csv").read_text())
+        assert reports[0] == reports[1] and "similar structure,1001-a,1002-b" in reports[0]
+
+    def test_structure_pairs_complete(self, monkeypatch):
+        rand = random.Random(3)
+        sources = []
+        for _ in range(30):
+            src = Source()
+            for path in rand.sample([f"/{d}/{name}{k}.{suffix}" for d in ["src", "lab", "src/main"]
+                                     for name in ["Main", "Test", "Util"] for k in range(3)
+                                     for suffix in ["java", "py"]], rand.randint(1, 6)):
+                src.append(path, rand.randint(0, 100))
+            sources.append(src)
+        expect = {(i, j) for i in range(len(sources)) for j in range(i + 1, len(sources))
+                  if SourceAnalyzer(sources[i], sources[j]).similar_structure()}
+        result = screen.FeatureScreen(sources).structure_pairs()
+        assert 0 < len(expect) and expect <= result < {(i, j) for i in range(30) for j in range(i + 1, 30)}
+        monkeypatch.setattr(screen, "numpy", None)
+        assert screen.FeatureScreen(sources).structure_pairs() == result
+
+    def test_rescore_below_check_threshold(self, tmp_path):
+        # 源码内容重合约40%的作业对：检查时不相似，降低阈值重新标记后相似
+        parts = [java_statements(seed) for seed in range(5)]
+        members = {
+            "1001-a": ({"homework/solver/Solver.java": parts[0] + parts[1] + parts[2]}, "需求分析实验报告.doc"),
+            "1002-b": ({"project/engine/Runner.java": parts[0] + parts[3] + parts[4], "notes.txt": "x" * 9000},
+                       "测试用例设计.doc"),
+            "1003-c": ({"web/C.java": java_statements(5)}, "lab-report-final.doc"),
+            "1004-d": ({"app/src/D.java": java_statements(6)}, "总结.doc"),
+        }
+        check_package(tmp_path, members, tmp_path / "Output", scores_path=tmp_path / "scores.db")
+        names, rows = score.load_scores(tmp_path / "scores.db")
+        # 共享公共语句但重合比例低于最宽松阈值的作业对不保存
+        assert {(names[l], names[r]) for l, r, _ in rows} == {("1001-a", "1002-b")}
+        scores = {(names[l], names[r]): it for l, r, it in rows}[("1001-a", "1002-b")]
+        assert scores[:3] == (None, None, None) and 0.3 < max(scores[3:5]) < 0.5
+        flags = {(names[l], names[r]): flag for l, r, flag, _ in score.rescore(rows, score.Thresholds())}
+        assert flags[("1001-a", "1002-b")] == 0
+        flags = {(names[l], names[r]): flag for l, r, flag, _ in
+                 score.rescore(rows, score.Thresholds(overlap_ratio=0.3))}
+        assert flags[("1001-a", "1002-b")] == 0b1000
+
+    def test_report_name_pairs(self, monkeypatch):
+        names = [("实验报告.doc", "实验报告.doc"), ("实验报告 .doc", "实验报告.doc"), ("", ""), ("", ""),
+                 ("report.docx", "report.docx"), ("repotr.docx", "report1.docx"), ("xyz.doc", "xyz.doc")]
+        expect = {(l, r) for l in range(len(names)) for r in range(l + 1, len(names))
+                  if difflib.SequenceMatcher(None, names[l][0], names[r][1]).ratio() > 0.8}
+        result = screen.FeatureScreen.report_name_pairs(names, 0.8)
+        assert expect <= result
+        monkeypatch.setattr(screen, "numpy", None)
+        assert screen.FeatureScreen.report_name_pairs(names, 0.8) == result
+
+    def test_parallel_check_pairs(self, monkeypatch):
+        sources = []
+        for i in range(9):
+            src = Source()
+            for j in range(i % 3 + 1):
+                src.append(f"/Lab01/src/pkg{i % 2}/Class{j}.java", 100 + i * 3 + j)
+            sources.append(src)
+        report_keys = [(f"lab01-report-{i % 4}.docx", f"lab01-report-{i % 3}.docx") for i in range(9)]
+        jobs = [(l, r) for l in range(9) for r in range(l + 1, 9)]
+        monkeypatch.setattr(assignment, "CHECK_TILE", 2)  # 分块数多于进程数
+        expect = assignment.check_pairs(sources, report_keys, jobs, 1)
+        assert assignment.check_pairs(sources, report_keys, jobs, 3) == expect
+
+    def test_parallel_check_profile(self, monkeypatch):
+        recorder = profiler.Profiler()
+        monkeypatch.setattr(profiler, "PROFILER", recorder)
+        monkeypatch.setattr(assignment, "PROFILER", recorder)
+        monkeypatch.setattr(assignment, "CHECK_TILE", 2)
+        recorder.enable()
+        with profiler.span("extract"):
+            profiler.count("bytes_extracted", 1000)
+        sources = []
+        for i in range(6):
+            src = Source()
+            src.append(f"/Lab01/src/Class{i}.java", 100 + i)
+            sources.append(src)
+        jobs = [(l, r) for l in range(6) for r in range(l + 1, 6)]
+        assignment.check_pairs(sources, [("a.doc", "a.doc")] * 6, jobs, 3)
+        # 工作进程继承的主进程记录不应被重复合并
+        assert recorder.counters == {"bytes_extracted": 1000}
+        assert [it[0] for it in recorder.spans].count("extract") == 1
+        assert [it[0] for it in recorder.spans].count("SourceAnalyzer.similar_structure") == len(jobs)
+
+    def test_parallel_process_package(self, tmp_path, capsys):
+        rand = random.Random(3)
+        with zipfile.ZipFile(tmp_path / "Lab01.zip", "w") as package:
+            for i in range(10):
+                nested = io.BytesIO()
+                with zipfile.ZipFile(nested, "w") as archive:
+                    archive.writestr("util/Helper.java", java_statements(100 + i))
+                data = io.BytesIO()
+                with zipfile.ZipFile(data, "w") as archive:
+                    for j in range(rand.randint(1, 4)):
+                        archive.writestr(f"Lab01/src/Class{j}.java", java_statements(i * 10 + j))
+                    archive.writestr("Lab01/.idea/workspace.xml", "x" * rand.randint(1, 100))
+                    archive.writestr("Lab01/lib.zip", nested.getvalue())
+                    archive.writestr(f"Lab01/{100 + i}-s{i}-实验报告.docx", b"")
+                package.writestr(f"{100 + i}-s{i}.zip", data.getvalue())
+        (tmp_path / "students.csv").write_text("num,full,short\n" +
+                                               "".join(f"{100 + i},S{i},s{i}\n" for i in range(10)))
+        results = []
+        for workers in [1, 3]:
+            output_path = tmp_path / f"Output{workers}"
+            output_path.mkdir()
+            log = journal.Journal(tmp_path / f"Lab01-{workers}.journal")
+            manager = assignment.AssignmentManager("Lab01", journal=log)
+            with zipfile.ZipFile(tmp_path / "Lab01.zip") as package:
+                capsys.readouterr()
+                manager.process_package(package, StudentInfo(str(tmp_path / "students.csv")), output_path,
+                                        workers=workers, id_pattern=r"^\d+")
+                keys = [cache.ResultCache.key(file) for file in package.filelist]
+            printed = capsys.readouterr().out.replace(str(output_path), "")
+            manager.check(output_path, scores_path=output_path / "scores.db")
+            recorded = []
+            for key in keys:
+                source, report, filtered = log.get(key)
+                recorded.append((list(source), list(source.sizes), list(source.hashes), list(source.normalized_hashes),
+                                 source.fingerprints, report.original_filename, report.file_size, report.fingerprints,
+                                 filtered))
+            log.close()
+            tree = {str(path.relative_to(output_path)): path.read_bytes()
+                    for path in sorted(output_path.rglob("*")) if path.is_file() and path.name != "scores.db"}
+            results.append((printed, score.load_scores(output_path / "scores.db"), recorded, tree))
+        assert "[Info]Processing Assignment: 109-s9" in results[0][0]
+        assert len([name for name in results[0][3] if name.endswith("Helper.java")]) == 10
+        assert results[0] == results[1]
+
+    def test_parallel_journal_records_completed_shares(self, tmp_path, monkeypatch):
+        members = {f"100{i}-s{i}": ({"Lab01/src/Main.java": java_statements(i)}, "实验报告.doc") for i in range(8)}
+        write_package(tmp_path, members)
+        process_member = assignment.process_member
+
+        def slow_failure(package, member, lab_num, student_info, base_path, check):
+            if student_info.num == "1000":  # 第一个分片最后完成且处理失败
+                time.sleep(1)
+                raise RuntimeError("interrupted")
+            return process_member(package, member, lab_num, student_info, base_path, check)
+
+        monkeypatch.setattr(assignment, "process_member", slow_failure)
+        log = journal.Journal(tmp_path / "Lab01.journal")
+        manager = assignment.AssignmentManager("Lab01", journal=log)
+        with zipfile.ZipFile(tmp_path / "Lab01.zip") as package:
+            with pytest.raises(RuntimeError):
+                manager.process_package(package, StudentInfo(str(tmp_path / "students.csv")), tmp_path / "Output",
+                                        workers=2, id_pattern=r"^\d+")
+        log.close()
+        # 之后完成的分片在失败前已经记录
+        assert len(journal.Journal(tmp_path / "Lab01.journal")) == 7
+
+    def test_group_pairs_transitive(self):
+        # A~B, C~B, A~C 与检查顺序无关，均应合并为同一组
+        edges = [(0, 1, 0b010), (1, 2, 0b010), (0, 2, 0b010), (3, 4, 0b001), (1, 4, 0b001)]
+        assert cluster.group_pairs(edges) == [(0b010, [0, 1, 2]), (0b001, [1, 3, 4])]
+
+    def test_decode_file_names(self):
+        def info(name: str, encoding: str = "", flag: int = 0) -> zipfile.ZipInfo:
+            result = zipfile.ZipInfo(name.encode(encoding).decode("cp437") if encoding else name)
+            result.flag_bits = flag
+            return result
+
+        gbk = [info("实验一/源码.java", "gbk"), info("src/Main.java"), info("实验一/报告.docx", "gbk")]
+        assert fileUtil.decode_file_names(gbk) == ["实验一/源码.java", "src/Main.java", "实验一/报告.docx"]
+        # 设置了UTF-8标志位的文件名不再重新解码；编码混合时逐个解码
+        mixed = [info("café.java", flag=fileUtil.UTF8_FLAG), info("源码.java", "utf-8"), info("报告.doc", "gbk")]
+        assert fileUtil.decode_file_names(mixed) == ["café.java", "源码.java", "报告.doc"]
+        assert fileUtil.separate_path_filename("Lab01/src/Main.java") == ("Lab01/src", "Main.java")
+
+    def test_write_behind_extract(self, tmp_path):
+        # 小文件后台写入，大文件直接写入，超过实际大小限制的文件不留下内容
+        data = {"a.txt": b"a" * 10, "big.bin": b"b" * 5000, "c/d.txt": b""}
+        with zipfile.ZipFile(tmp_path / "in.zip", "w") as f:
+            for name, content in data.items():
+                f.writestr(name, content)
+        with zipfile.ZipFile(tmp_path / "in.zip") as f:
+            with fileUtil.FileWriter(workers=2, max_pending=16, file_limit=1024) as writer:
+                for info in f.infolist():
+                    path, name = fileUtil.separate_path_filename(f"out/{info.filename}")
+                    fileUtil.extract_file(f, info, str(tmp_path / path), name, 100, writer=writer)
+                with pytest.raises(fileUtil.FileSizeExceeded):
+                    fileUtil.extract_file(f, "big.bin", str(tmp_path), "limited.bin", 100, 4000, writer)
+        for name, content in data.items():
+            assert (tmp_path / "out" / name).read_bytes() == content
+        assert not (tmp_path / "limited.bin").exists()
+
+    def test_source_interned_paths(self):
+        # 序列化后重新驻留路径，结构比较结果不变
+        left, right = Source(), Source()
+        for path, size in [("/Lab01/src/Main.java", 10), ("/Lab01/src/util/Helper.java", 20), ("/pom.xml", 5)]:
+            left.append(path, size)
+        for path, size in [("/lab1/src/Main.java", 11), ("/lab1/src/utils/Helper.java", 19), ("/pom.xml", 5)]:
+            right.append(path, size)
+        restored = pickle.loads(pickle.dumps(right))
+        assert list(restored) == list(right) and list(restored.sizes) == [11, 19, 5] and restored.size == 35
+        assert restored.paths[2] is left.paths[2]
+        fast, slow = SourceAnalyzer(left, restored), SourceAnalyzer(left, right, fast=False)
+        assert fast.similar_structure() and slow.similar_structure()
+        assert fast.get_analysis() == slow.get_analysis()
+
+    def test_fast_structure_not_below_difflib(self):
+        # LCS相似度不低于difflib的ratio：difflib判定相似的文件快速比较同样判定相似，反之不一定
+        rand = random.Random(7)
+        stricter = 0
+        for _ in range(300):
+            left, right = Source(), Source()
+            for side in (left, right):
+                for _ in range(rand.randint(1, 4)):
+                    name = "".join(rand.choices("bcde", k=10))
+                    side.append(f"/Lab01/{rand.choice(['src', 'sra', 'scr'])}/{name}.java", 1)
+            if rand.random() < 0.3:
+                right.append(left[0], 1)
+            fast, slow = SourceAnalyzer(left, right), SourceAnalyzer(left, right, fast=False)
+            fast.similar_structure()
+            slow.similar_structure()
+            assert fast.structure_ratio >= slow.structure_ratio
+            fast_files = {path: ratio for path, _, ratio in fast.get_analysis()}
+            for path, _, ratio in slow.get_analysis():
+                assert fast_files[path] >= ratio
+            stricter += fast.structure_ratio > slow.structure_ratio
+        assert stricter > 0
+        left, right = Source(), Source()
+        left.append("/Lab01/src/bbdbcddbdc.java", 1)
+        right.append("/Lab01/sra/bbebcdbbdb.java", 1)
+        assert SourceAnalyzer(left, right).similar_structure()
+        assert not SourceAnalyzer(left, right, fast=False).similar_structure()
+
 
 # Remove unnecessary docs
 def rm_docs(path: Path):
@@ -79,3 +686,43 @@ def check_output_expected(exp: Path, out: Path) -> bool:
                 return False
 
     return True
+
+
+def write_package(tmp_path: Path, members: dict):
+    """生成作业包Lab01.zip与学生信息表students.csv
+    :param members: 学生作业文件名(学号-姓名) -> ({文件路径: 内容}, 实验报告文件名)
+    """
+    with zipfile.ZipFile(tmp_path / "Lab01.zip", "w") as package:
+        for member, (files, report) in members.items():
+            data = io.BytesIO()
+            with zipfile.ZipFile(data, "w") as archive:  # 固定修改时间，内容相同的作业CRC不变
+                for path, text in files.items():
+                    archive.writestr(zipfile.ZipInfo(path, (2021, 1, 1, 0, 0, 0)), text)
+                archive.writestr(zipfile.ZipInfo(f"Lab01/{report}", (2021, 1, 1, 0, 0, 0)), b"")
+            package.writestr(f"{member}.zip", data.getvalue())
+    (tmp_path / "students.csv").write_text("num,full,short\n" + "".join(
+        f"{member.split('-')[0]},{member.split('-')[1].upper()},{member.split('-')[1]}\n" for member in members))
+
+
+def check_package(tmp_path: Path, members: dict, output_path: Path, **kwargs):
+    """生成作业包并以不解压方式处理、检查
+    :param members: 同write_package
+    """
+    write_package(tmp_path, members)
+    output_path.mkdir()
+    manager = assignment.AssignmentManager("Lab01")
+    with zipfile.ZipFile(tmp_path / "Lab01.zip") as package:
+        manager.process_package(package, StudentInfo(str(tmp_path / "students.csv")), output_path,
+                                check=assignment.AssignmentChecker(extract=False), id_pattern=r"^\d+")
+    manager.check(output_path, **kwargs)
+
+
+def java_statements(seed: int, count: int = 30) -> str:
+    """随机生成的Java语句，不同种子的结果几乎不共享指纹"""
+    rand = random.Random(seed)
+    statements = ["a = b {} c;", "if (a {} b) {{ return; }}", "x[{}] = y;", "while (a) {{ a--; }}",
+                  "foo(a, \"s\", 'c');", "int[] v = new int[{}];", "throw new E();", "synchronized (o) {{ o.wait(); }}",
+                  "assert a != null;", "for (;;) {{ break; }}", "switch (a) {{ default: }}",
+                  "try {{ f(); }} catch (E e) {{ }}"]
+    operators = ["+", "-", "*", "/", "%", "<<", ">>", "&&", "||"]
+    return "\n".join(rand.choice(statements).format(rand.choice(operators)) for _ in range(count)) + "\n"